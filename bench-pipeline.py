@@ -0,0 +1,382 @@
+# Benchmark import.py and createpages.py end to end, on a synthetic catalogue replayed from a cassette, so no network is needed
+# The catalogue has a Spotify RSS feed, a YouTube Atom feed, an iTunes lookup, YouTube API playlists and uploads,
+# and AWS Transcribe transcripts listed in S3. Each episode's content only depends on its number, so adding episodes doesn't change the others.
+# Each step is run:
+#   cold            from an empty folder
+#   warm            again, with nothing changed
+#   incremental     after new episodes have been added to the catalogue
+# The wall time, CPU time, peak RSS and the number of files each step created, changed or removed are written as JSON,
+# with the step's own timings and counters from --metrics-out.
+# Requires the packages in requirements.txt, as import.py does.
+# python bench-pipeline.py [--episodes 200] [--words 2000] [--new 5] [--jobs 4] [--folder path] [--output path]
+import io
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import escape
+
+from cassette import Cassette
+from youtubeapi import YouTubeAPI, getRecordedUrl
+from youtubeplaylists import YouTubePlaylists
+from fetcheryoutubeapi import UploadsRequest
+
+spotifyUrl = 'https://anchor.fm/s/bench/podcast/rss'
+youtubeRssUrl = 'https://www.youtube.com/feeds/videos.xml?channel_id=UCbench'
+itunesId = 1000000001
+itunesUrl = f"https://itunes.apple.com/lookup?id={itunesId}&media=podcast&entity=podcastEpisode&limit=200"
+channelId = 'UCbench'
+uploadsId = 'UUbench'
+bucket = 'bench'
+playlistCount = 8
+firstPublished = datetime(2018, 1, 1, 18, tzinfo=timezone.utc)
+# The last modified time of the transcripts in S3
+transcribed = datetime(2018, 1, 1, tzinfo=timezone.utc)
+
+firstNames = ['Ada', 'Alan', 'Grace', 'Claude', 'Barbara', 'Edsger', 'Frances', 'Donald', 'Radia', 'Ken']
+lastNames = ['Lovelace', 'Turing', 'Hopper', 'Shannon', 'Liskov', 'Dijkstra', 'Allen', 'Knuth', 'Perlman', 'Thompson']
+topics = ['Consciousness', 'Free Will', 'The Scientific Method', 'Mathematics', 'Language', 'Ethics', 'Evolution', 'Cosmology']
+words = 'so I think that the question is really about how we know things and whether science can tell us anything about it'.split()
+fillers = ['um', 'uh', 'Um', 'mhm']
+
+# The episode with number n
+def MakeEpisode(n):
+    rng = random.Random(f"episode-{n}")
+    guest = rng.choice(firstNames) + ' ' + rng.choice(lastNames)
+    topic = rng.choice(topics)
+    published = firstPublished + timedelta(days=7 * n)
+    paragraphs = [' '.join(rng.choice(words) for i in range(rng.randint(20, 60))).capitalize() + '.' for j in range(rng.randint(2, 5))]
+    timestamps = [f"{minutes // 60:02d}:{minutes % 60:02d} {rng.choice(topics)}" for minutes in sorted(rng.sample(range(1, 120), 6))]
+    return {
+        'number': n,
+        'title': f"#{n} {guest}: {topic} and {rng.choice(topics)}",
+        'published': published,
+        'paragraphs': paragraphs,
+        'timestamps': timestamps,
+        'videoId': f"vid{n:08d}",
+        'playlists': sorted(rng.sample(range(1, playlistCount + 1), rng.randint(1, 2))),
+        # Every fourth episode hasn't been transcribed
+        'transcribed': n % 4 != 0
+    }
+
+def SpotifyRss(episodes):
+    items = []
+    for episode in episodes:
+        description = ''.join(f"<p>{paragraph}</p>" for paragraph in episode['paragraphs']) + '<p>' + '<br>'.join(episode['timestamps']) + '</p>'
+        items.append(
+            '<item>'
+            f"<title><![CDATA[{episode['title']}]]></title>"
+            f"<description><![CDATA[{description}]]></description>"
+            f"<link>https://podcasters.spotify.com/pod/show/bench/episodes/{episode['number']}</link>"
+            f"<guid isPermaLink=\"false\">bench-{episode['number']}</guid>"
+            f"<pubDate>{episode['published'].strftime('%a, %d %b %Y %H:%M:%S GMT')}</pubDate>"
+            f"<enclosure url=\"https://anchor.fm/s/bench/podcast/play/{episode['number']}.m4a\" length=\"1000000\" type=\"audio/x-m4a\"/>"
+            f"<itunes:image href=\"https://d3t3ozftmdmh3i.cloudfront.net/bench/{episode['number']}.jpg\"/>"
+            '</item>\n'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"><channel><title>Bench</title>\n'
+        + ''.join(items) +
+        '</channel></rss>\n'
+    )
+
+# YouTube's feed only has the latest 15 videos
+def YoutubeRss(episodes):
+    entries = []
+    for episode in episodes[:15]:
+        description = '\n\n'.join(episode['paragraphs']) + '\n\n' + '\n'.join(episode['timestamps'])
+        entries.append(
+            '<entry>'
+            f"<id>yt:video:{episode['videoId']}</id>"
+            f"<yt:videoId>{episode['videoId']}</yt:videoId>"
+            f"<title>{escape(episode['title'])}</title>"
+            f"<published>{episode['published'].isoformat()}</published>"
+            '<media:group>'
+            f"<media:title>{escape(episode['title'])}</media:title>"
+            f"<media:thumbnail url=\"https://i{episode['number'] % 4 + 1}.ytimg.com/vi/{episode['videoId']}/hqdefault.jpg\" width=\"480\" height=\"360\"/>"
+            f"<media:description>{escape(description)}</media:description>"
+            '</media:group>'
+            '</entry>\n'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns:media="http://search.yahoo.com/mrss/" xmlns="http://www.w3.org/2005/Atom">\n'
+        + ''.join(entries) +
+        '</feed>\n'
+    )
+
+# The lookup returns the podcast, then at most 200 episodes
+def ItunesLookup(episodes):
+    results = [{ 'wrapperType': 'track', 'kind': 'podcast', 'collectionId': itunesId, 'trackName': 'Bench' }]
+    for episode in episodes[:200]:
+        results.append({
+            'wrapperType': 'podcastEpisode',
+            'kind': 'podcast-episode',
+            'trackId': itunesId + episode['number'],
+            'trackName': episode['title'],
+            'releaseDate': episode['published'].strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'description': '\n\n'.join(episode['paragraphs']),
+            'artworkUrl600': f"https://is1-ssl.mzstatic.com/image/thumb/bench/{episode['number']}/600x600bb.jpg",
+            'trackViewUrl': f"https://podcasts.apple.com/us/podcast/bench/id{itunesId}?i={itunesId + episode['number']}"
+        })
+    return json.dumps({ 'resultCount': len(results), 'results': results })
+
+# An AWS Transcribe transcript of about 6 minutes per 1000 words, alternating between the interviewer and the guest
+def TranscribeJson(episode, wordCount):
+    rng = random.Random(f"transcript-{episode['number']}")
+    items = []
+    segments = []
+    segment = None
+    t = 0.0
+    speaker = 0
+    for i in range(wordCount):
+        if rng.random() < 0.02:
+            speaker = 1 - speaker
+        duration = rng.choice([0.2, 0.3, 0.35, 0.45])
+        start = f"{t:.2f}"
+        end = f"{t + duration:.2f}"
+        t += duration + rng.choice([0, 0.01])
+        content = rng.choice(fillers) if rng.random() < 0.05 else rng.choice(words)
+        items.append({ 'start_time': start, 'end_time': end, 'alternatives': [{ 'confidence': '0.9', 'content': content }], 'type': 'pronunciation' })
+        label = f"spk_{speaker}"
+        if segment is None or segment['speaker_label'] != label:
+            segment = { 'start_time': start, 'speaker_label': label, 'end_time': end, 'items': [] }
+            segments.append(segment)
+        segment['items'].append({ 'start_time': start, 'speaker_label': label, 'end_time': end })
+        segment['end_time'] = end
+        if rng.random() < 0.1:
+            items.append({ 'alternatives': [{ 'confidence': '0.0', 'content': rng.choice(['.', ',', '?']) }], 'type': 'punctuation' })
+    return json.dumps({ 'jobName': str(episode['number']), 'results': { 'transcripts': [{ 'transcript': '' }], 'speaker_labels': { 'speakers': 2, 'segments': segments }, 'items': items } })
+
+def Etag(data):
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode('utf-8'), digest_size=8).hexdigest()
+
+# Split items into pages of 50, as the YouTube API returns them, each with its etag and the token of the next page
+def YoutubePages(items):
+    pages = []
+    for start in range(0, max(len(items), 1), 50):
+        page = { 'items': items[start:start + 50] }
+        if start + 50 < len(items):
+            page['nextPageToken'] = f"page{start + 50}"
+        page['etag'] = Etag(page)
+        pages.append(page)
+    return pages
+
+# Record the responses to the YouTube API requests the youtube-api source makes, in full mode
+def RecordYoutubeApi(cassette, folder, episodes):
+    youtubeAPI = YouTubeAPI({ 'test': 'load', 'test-path': folder })
+    playlists = YouTubePlaylists(youtubeAPI, channelId)
+
+    def Record(request, response):
+        recorded = { 'method': request.method, 'url': getRecordedUrl(request.uri) }
+        cassette.save('youtube', recorded, { 'status': 200, 'body': response })
+
+    # The uploads, newest first
+    request = UploadsRequest(youtubeAPI, uploadsId)
+    for page in YoutubePages([{
+        'id': f"item-{episode['videoId']}",
+        'snippet': {
+            'title': episode['title'],
+            'publishedAt': episode['published'].strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'description': '\n\n'.join(episode['paragraphs']) + '\n\n' + '\n'.join(episode['timestamps']),
+            'resourceId': { 'videoId': episode['videoId'] },
+            'thumbnails': { 'maxres': { 'url': f"https://i.ytimg.com/vi/{episode['videoId']}/maxresdefault.jpg" } }
+        }
+    } for episode in episodes]):
+        Record(request, page)
+        request = youtubeAPI.youtube.playlistItems().list_next(request, page)
+
+    # The playlists and their items
+    members = { playlistNo: [episode for episode in episodes if playlistNo in episode['playlists']] for playlistNo in range(1, playlistCount + 1) }
+    items = []
+    for playlistNo in range(1, playlistCount + 1):
+        playlistId = f"PLbench{playlistNo}"
+        pageToken = ''
+        for page in YoutubePages([{ 'snippet': { 'title': episode['title'], 'resourceId': { 'videoId': episode['videoId'] } } } for episode in members[playlistNo]]):
+            Record(playlists.playlistPageRequest(playlistId, pageToken), page)
+            pageToken = page['nextPageToken'] if 'nextPageToken' in page else None
+        version = { 'id': playlistId, 'snippet': { 'title': topics[playlistNo - 1] }, 'contentDetails': { 'itemCount': len(members[playlistNo]) } }
+        version['etag'] = Etag([version, [episode['videoId'] for episode in members[playlistNo]]])
+        items.append(version)
+    pageToken = ''
+    for page in YoutubePages(items):
+        Record(playlists.playlistsRequest(pageToken), page)
+        pageToken = page['nextPageToken'] if 'nextPageToken' in page else None
+    youtubeAPI.executor.shutdown()
+
+def RecordHttp(cassette, url, body, contentType, modified):
+    body = body.encode('utf-8')
+    headers = {
+        'Content-Type': contentType,
+        'ETag': '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"',
+        'Last-Modified': modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    }
+    cassette.save('http', { 'method': 'GET', 'url': url }, { 'status': 200, 'headers': headers }, io.BytesIO(body))
+
+# Record the catalogue of the first count episodes in the cassette in folder, replacing any previous catalogue
+def MakeCatalogue(folder, count, wordCount):
+    cassette = Cassette(os.path.join(folder, 'cassette'), 'save')
+    # Newest first, as the feeds list them
+    episodes = [MakeEpisode(n) for n in range(count, 0, -1)]
+    modified = episodes[0]['published']
+
+    RecordHttp(cassette, spotifyUrl, SpotifyRss(episodes), 'application/rss+xml', modified)
+    RecordHttp(cassette, youtubeRssUrl, YoutubeRss(episodes), 'text/xml', modified)
+    RecordHttp(cassette, itunesUrl, ItunesLookup(episodes), 'text/javascript', modified)
+    RecordYoutubeApi(cassette, folder, episodes)
+
+    # The transcripts in S3, with no audio waiting to be transcribed
+    transcripts = [episode for episode in reversed(episodes) if episode['transcribed']]
+    contents = []
+    for episode in transcripts:
+        key = f"transcript/{episode['number']}.json"
+        body = TranscribeJson(episode, wordCount).encode('utf-8')
+        cassette.save('s3', { 'operation': 'get_object', 'params': { 'Bucket': bucket, 'Key': key } }, {}, io.BytesIO(body))
+        contents.append({ 'Key': key, 'LastModified': transcribed.isoformat(), 'Size': len(body) })
+    for prefix, objects in (('transcript', contents), ('episode', [])):
+        pages = [{ 'Contents': objects[start:start + 1000] } for start in range(0, max(len(objects), 1), 1000)]
+        cassette.save('s3', { 'operation': 'list_objects_v2', 'params': { 'Bucket': bucket, 'Prefix': prefix } }, { 'pages': pages })
+
+def MakeConfig(folder):
+    config = {
+        'test': 'load',
+        'test-path': '.',
+        'bucket': bucket,
+        # Don't download audio to upload for transcription
+        'transcribe-max': 0,
+        'episode-folder': 'episode',
+        'page-folder': 'page',
+        'vtt-folder': 'vtt',
+        'ums': ['um', 'uh', 'mhm'],
+        'defaults': { 'interviewer': ['Host'] },
+        'transcript-disclaimer': 'This transcript was generated automatically.\n\n',
+        'source': {
+            'Spotify': { 'type': 'rss', 'url': spotifyUrl, 'primary': True },
+            'YouTube via RSS': { 'type': 'youtube-rss', 'url': youtubeRssUrl, 'primary': False },
+            'YouTube via API': { 'type': 'youtube-api', 'channel': channelId, 'playlist': uploadsId, 'primary': False, 'only-new': False },
+            'itunes': { 'type': 'itunes', 'id': itunesId, 'primary': False },
+            'AWS Transcribe': { 'type': 'transcript', 'primary': False }
+        }
+    }
+    with open(os.path.join(folder, 'incharge-podcaster.json'), mode='w', encoding='utf-8') as file:
+        json.dump(config, file, indent='\t')
+
+# Get the size and mtime of every file under folder, except the cassette, the metrics and the log
+def Snapshot(folder):
+    files = {}
+    for root, dirs, filenames in os.walk(folder):
+        if root == folder:
+            dirs.remove('cassette')
+            dirs.remove('metrics')
+            filenames = [filename for filename in filenames if filename != 'bench.log']
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            files[path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+# Run a script in folder, and measure it
+def Run(name, script, folder, jobs, log):
+    metricsPath = os.path.join(folder, 'metrics', f"{name}-{os.path.splitext(script)[0]}.json")
+    before = Snapshot(folder)
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script), '-j', str(jobs), '--metrics-out', metricsPath],
+        cwd=folder, stdout=log, stderr=subprocess.STDOUT
+    )
+    # wait4 gives the resource usage of just this process
+    pid, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    # The process has been waited for, so Popen mustn't wait for it again
+    process.returncode = os.waitstatus_to_exitcode(status)
+    after = Snapshot(folder)
+    metrics = None
+    if os.path.isfile(metricsPath):
+        with open(metricsPath, mode='r', encoding='utf-8') as file:
+            metrics = json.load(file)
+    return {
+        'exit': process.returncode,
+        'seconds': round(seconds, 3),
+        'user': round(usage.ru_utime, 3),
+        'system': round(usage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+        'peakRss': usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024,
+        'created': sum(1 for path in after if path not in before),
+        'changed': sum(1 for path, stamp in after.items() if path in before and before[path] != stamp),
+        'removed': sum(1 for path in before if path not in after),
+        'metrics': metrics
+    }
+
+def Benchmark(folder, args):
+    MakeConfig(folder)
+    os.makedirs(os.path.join(folder, 'metrics'))
+    runs = []
+    with open(os.path.join(folder, 'bench.log'), mode='w', encoding='utf-8') as log:
+        for name in ('cold', 'warm', 'incremental'):
+            if name == 'cold':
+                MakeCatalogue(folder, args.episodes, args.words)
+            elif name == 'incremental':
+                MakeCatalogue(folder, args.episodes + args.new, args.words)
+            for script in ('import.py', 'createpages.py'):
+                print(f"{name} {script}", end=' ', flush=True)
+                log.write(f"---- {name} {script}\n")
+                log.flush()
+                result = Run(name, script, folder, args.jobs, log)
+                print(f"{result['seconds']:.2f}s {result['peakRss'] / 1048576:.0f}MB "
+                    f"created {result['created']} changed {result['changed']} removed {result['removed']}")
+                runs.append({ 'run': name, 'step': script } | result)
+                if result['exit'] != 0:
+                    print(f"ERROR: {script} failed with exit code {result['exit']}. See {log.name}")
+                    return runs
+    return runs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, default=200)
+    # Words per transcript
+    parser.add_argument('--words', type=int, default=2000)
+    # Episodes added for the incremental run
+    parser.add_argument('--new', type=int, default=5)
+    parser.add_argument('-j', '--jobs', type=int, default=4)
+    # Run in this folder, which is kept, rather than a temporary one
+    parser.add_argument('--folder')
+    # Write the results to this file, rather than bench-pipeline.json in the run folder, or the temporary folder if there isn't one
+    parser.add_argument('-o', '--output')
+    args = parser.parse_args()
+    if not args.output:
+        args.output = os.path.join(args.folder if args.folder else tempfile.gettempdir(), 'bench-pipeline.json')
+
+    started = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    if args.folder:
+        os.makedirs(args.folder)
+        runs = Benchmark(os.path.abspath(args.folder), args)
+    else:
+        with tempfile.TemporaryDirectory() as folder:
+            runs = Benchmark(folder, args)
+
+    results = {
+        'started': started,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'episodes': args.episodes,
+        'words': args.words,
+        'new': args.new,
+        'jobs': args.jobs,
+        'runs': runs
+    }
+    with open(args.output, mode='w', encoding='utf-8') as file:
+        json.dump(results, file, indent='\t')
+    print(f"Results written to {args.output}")
+    if any(run['exit'] != 0 for run in runs):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# Compare the shownotes cleaner with the original sequence of re.sub calls
+# The output must be identical for every description, and the cleaner should be faster.
+# python bench-shownotes.py [repeats]
+import re
+import sys
+import time
+import xml.etree.ElementTree as et
+
+from shownotes import getShownotesCleaner
+
+# The original implementation of Fetcher.TrimShownotes
+def LegacyTrimShownotes(shownotes):
+    shownotes = re.sub(r"^[\*\-]+Support the channel[\*\-]+$.*enlites\.com/\n", '', shownotes, flags=re.DOTALL | re.MULTILINE)
+    shownotes = re.sub(r"------------------Support the channel------------.*enlites\.com/\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r"------------------Support the channel------------.*anchor\.fm/thedissenter\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r"------------------Support the channel------------.*twitter\.com/TheDissenterYT\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r'^[\n]*', '', shownotes)
+    shownotes = re.sub(r'[-]*\nA HUGE THANK YOU.*$', '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r'\n *-[-]+ *\n', '\n\n---\n\n', shownotes)
+    shownotes = re.sub(r'([^\n])\n([^\n])', r'\1  \n\2', shownotes)
+    shownotes = re.sub(r"^(([0-9]{1,2}:)?[0-9]{2}:[0-9]{2}) *(.*)$", r"<time>\1</time> \3", shownotes, flags=re.MULTILINE)
+    return shownotes
+
+# The original implementation of Fetcher.TrimShownotesHtml
+def LegacyTrimShownotesHtml(shownotes):
+    shownotes = re.sub(r"<p>[\*\-]+Support the channel[\*\-]+</p>.*enlites\.com/</a></p>\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r"<p>------------------Support the channel------------</p>.*enlites\.com/</a></p>\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r"<p>------------------Support the channel------------</p>.*anchor\.fm/thedissenter</a></p>\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r"<p>------------------Support the channel------------</p>.*twitter\.com/TheDissenterYT</a></p>\n", '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r"^<p>[ -\xA0]*</p>\n", '', shownotes)
+    shownotes = re.sub(r"^<p><br></p>\n", '', shownotes)
+    shownotes = re.sub(r"^\n", '', shownotes)
+    shownotes = re.sub(r'<p><a href="">A HUGE THANK YOU.*$', '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r'<p>A HUGE THANK YOU.*$', '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r'<p>[ -]*</p>\n$', '', shownotes, flags=re.DOTALL)
+    shownotes = re.sub(r'\n\n$', '\n', shownotes)
+    return shownotes
+
+# Get the descriptions from the test YouTube feed
+def LoadDescriptions(path):
+    mediaNamespace = '{http://search.yahoo.com/mrss/}'
+    root = et.parse(path).getroot()
+    return [
+        entry.find(mediaNamespace + 'group').find(mediaNamespace + 'description').text
+        for entry in root.iter('{http://www.w3.org/2005/Atom}entry')
+    ]
+
+# Convert a plain text description to Spotify style HTML, with a paragraph per line and links for urls
+def ToHtml(description):
+    html = ''
+    for line in description.split('\n'):
+        line = re.sub(r'(https?://[^ ]+)', r'<a href="\1">\1</a>', line)
+        html += '<p>' + line + '</p>\n'
+    return html
+
+# Variations covering the formats used by older episodes
+def MakeVariations(descriptions):
+    variations = []
+    for description in descriptions:
+        variations.append(description)
+        # Without the support block
+        variations.append(re.sub(r'^.*?enlites\.com/\n', '', description, flags=re.DOTALL))
+        # 950+ format
+        variations.append(description.replace('------------------Support the channel------------', '***Support the channel***'))
+        # Ending at twitter, as in 1-145
+        variations.append(re.sub(r'(twitter\.com/TheDissenterYT\n).*?enlites\.com/\n', r'\1', description, flags=re.DOTALL))
+        # Without credits, and with blank lines at the start
+        variations.append('\n\n' + re.sub(r'\nA HUGE THANK YOU.*$', '\n', description, flags=re.DOTALL))
+    return variations
+
+def Benchmark(name, function, descriptions, repeats):
+    start = time.perf_counter()
+    for i in range(repeats):
+        for description in descriptions:
+            function(description)
+    return time.perf_counter() - start
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    config = {}
+    textCleaner = getShownotesCleaner('text', config)
+    htmlCleaner = getShownotesCleaner('html', config)
+
+    texts = MakeVariations(LoadDescriptions('test/rss/youtuberss.xml'))
+    htmls = [ToHtml(text) for text in texts]
+
+    failures = 0
+    for kind, descriptions, legacy, cleaner in (
+        ('text', texts, LegacyTrimShownotes, textCleaner.clean),
+        ('html', htmls, LegacyTrimShownotesHtml, htmlCleaner.clean)
+    ):
+        for index, description in enumerate(descriptions):
+            if legacy(description) != cleaner(description):
+                print(f"ERROR: {kind} description {index} differs")
+                failures += 1
+
+        legacyTime = Benchmark('legacy', legacy, descriptions, repeats)
+        cleanerTime = Benchmark('cleaner', cleaner, descriptions, repeats)
+        print(f"{kind}: {len(descriptions)} descriptions x {repeats}: legacy {legacyTime:.3f}s, cleaner {cleanerTime:.3f}s, speed-up {legacyTime / cleanerTime:.1f}x")
+
+    if failures:
+        print(f"{failures} descriptions differ")
+        sys.exit(1)
+    print('All output is identical')
+
+if __name__ == '__main__':
+    main()
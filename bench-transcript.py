@@ -0,0 +1,126 @@
+# Compare transcriptToText with the original implementation on synthetic transcripts
+# The full size transcript is about 3 hours long with 30000 words. Halving the size should roughly halve the time,
+# so the time per word stays the same, including when a single speaker talks for the whole transcript.
+# The output must be identical.
+# python bench-transcript.py [words]
+import io
+import os
+import sys
+import json
+import time
+import random
+import codecs
+import datetime
+import tempfile
+
+from transcripttotext import transcriptToText, DeUm
+from transcript import loadTranscript
+
+# The original implementation of transcriptToText, after the speakers have been found
+def LegacyTranscriptToText(inputFilename, speakers, ums, outputfile):
+    with codecs.open(inputFilename, 'r', 'utf-8') as inputfile:
+        data=json.loads(inputfile.read())
+        labels = data['results']['speaker_labels']['segments']
+        speaker_start_times={}
+        for label in labels:
+            for item in label['items']:
+                speaker_start_times[item['start_time']] = int(item['speaker_label'][4:])
+        items = data['results']['items']
+        lines=[]
+        line=''
+        time=0
+        speaker=None
+        i=0
+        for item in items:
+            i=i+1
+            content = item['alternatives'][0]['content']
+            if item.get('start_time'):
+                current_speaker=speaker_start_times[item['start_time']]
+            elif item['type'] == 'punctuation':
+                line = line+content
+            if current_speaker != speaker:
+                if speaker is not None:
+                    lines.append({'speaker':speaker, 'line':line, 'time':time})
+                line=content
+                speaker=current_speaker
+                time=item['start_time']
+            elif item['type'] != 'punctuation':
+                line = line + ' ' + content
+        lines.append({'speaker':speaker, 'line':line,'time':time})
+        sorted_lines = sorted(lines,key=lambda k: float(k['time']))
+        for line_data in sorted_lines:
+            outputfile.write('<time>' + str(datetime.timedelta(seconds=int(round(float(line_data['time']))))) + '</time> ' \
+                + speakers[line_data.get('speaker')] + ': ' \
+                + DeUm(line_data.get('line'), ums) \
+                + '\n\n'
+            )
+
+# Write an AWS Transcribe style transcript of about 3 hours per 30000 words
+# switch is the probability that the speaker changes after each word
+def MakeTranscript(path, wordCount, switch, seed=0):
+    random.seed(seed)
+    words = 'so I think that the question is really about how we know things and whether science can tell us anything about it'.split()
+    items = []
+    segments = []
+    segment = None
+    t = 0.0
+    speaker = 0
+    for i in range(wordCount):
+        if random.random() < switch:
+            speaker = 1 - speaker
+        duration = random.choice([0.2, 0.3, 0.35, 0.45])
+        start = f"{t:.2f}"
+        end = f"{t + duration:.2f}"
+        t += duration + random.choice([0, 0.01])
+        items.append({ 'start_time': start, 'end_time': end, 'alternatives': [{ 'confidence': '0.9', 'content': random.choice(words) }], 'type': 'pronunciation' })
+        label = f"spk_{speaker}"
+        if segment is None or segment['speaker_label'] != label:
+            segment = { 'start_time': start, 'speaker_label': label, 'end_time': end, 'items': [] }
+            segments.append(segment)
+        segment['items'].append({ 'start_time': start, 'speaker_label': label, 'end_time': end })
+        segment['end_time'] = end
+        if random.random() < 0.1:
+            items.append({ 'alternatives': [{ 'confidence': '0.0', 'content': random.choice(['.', ',', '?']) }], 'type': 'punctuation' })
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({ 'jobName': 'benchmark', 'results': { 'transcripts': [{ 'transcript': '' }], 'speaker_labels': { 'speakers': 2, 'segments': segments }, 'items': items } }, file)
+    return t
+
+def Benchmark(function):
+    start = time.perf_counter()
+    output = io.StringIO()
+    function(output)
+    return time.perf_counter() - start, output.getvalue()
+
+def main():
+    fullSize = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    # DeUm is the same in both versions, so it is left out
+    config = { 'defaults': { 'interviewer': ['Interviewer'] } }
+    dataDict = { 'episodeid': 'benchmark', 'interviewee': ['Guest'] }
+    speakers = config['defaults']['interviewer'] + dataDict['interviewee']
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'transcript.json')
+        for name, switch in (('conversation', 0.02), ('monologue', 0)):
+            for wordCount in (fullSize // 4, fullSize // 2, fullSize):
+                seconds = MakeTranscript(path, wordCount, switch)
+                legacyTime, legacyOutput = Benchmark(lambda output: LegacyTranscriptToText(path, speakers, None, output))
+                # Time the whole job, including decoding the JSON, without the cache
+                newTime, newOutput = Benchmark(lambda output: transcriptToText(loadTranscript(path, False), dataDict, config, output))
+                # As a later page build would, with the decoded transcript read from transcript.bin
+                loadTranscript(path)
+                cachedTime, cachedOutput = Benchmark(lambda output: transcriptToText(loadTranscript(path), dataDict, config, output))
+                if newOutput != legacyOutput or cachedOutput != legacyOutput:
+                    print(f"ERROR: {name} {wordCount} words output differs")
+                    failures += 1
+                print(f"{name}: {wordCount} words, {seconds / 3600:.1f} hours: "
+                    f"legacy {legacyTime:.3f}s ({legacyTime / wordCount * 1e6:.1f}us/word), "
+                    f"new {newTime:.3f}s ({newTime / wordCount * 1e6:.1f}us/word), "
+                    f"cached {cachedTime:.3f}s ({cachedTime / wordCount * 1e6:.1f}us/word)")
+
+    if failures:
+        sys.exit(1)
+    print('All output is identical')
+
+if __name__ == '__main__':
+    main()
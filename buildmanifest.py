@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+
+from episodestore import writeJson
+
+# Records what each episode's pages were generated from, and what was generated, so a page is only rebuilt when its content would change.
+# Each entry, keyed by episodeid, is:
+#   inputs:     stamps of episode.json and transcript.json (or None)
+#   config:     hash of the config settings that affect the output
+#   outputs:    dictionary of output path: stamp, for the page and captions
+# It also lists the orphans, i.e. outputs of episodes that have been renamed or deleted, which were kept rather than removed.
+# A stamp is the size, mtime and content hash of a file. The hash is only recalculated when the size or mtime has changed,
+# so an unchanged catalogue is checked without reading the files, and a file that was only touched, e.g. by a checkout, still matches.
+# Paths are relative to the folder of the manifest, so it stays valid if the site is built somewhere else.
+class BuildManifest():
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.folder = os.path.dirname(path)
+        # Dictionary of episodeid: entry
+        self.entries = {}
+        # Paths of the orphans that were kept
+        self.orphans = []
+        self.changed = False
+        self.load()
+
+    def get(self, episodeid):
+        return self.entries.get(episodeid)
+
+    # Replace the entry of the episode, and return the outputs it had that it no longer has e.g. the old page of a renamed episode
+    def update(self, episodeid, entry):
+        previous = self.entries.get(episodeid)
+        if previous != entry:
+            self.entries[episodeid] = entry
+            self.changed = True
+        return [path for path in previous['outputs'] if path not in entry['outputs']] if previous else []
+
+    # Remove the entries of the episodes that aren't in episodeids, and return their outputs
+    def removeOthers(self, episodeids):
+        outputs = []
+        for episodeid in [episodeid for episodeid in self.entries if episodeid not in episodeids]:
+            outputs.extend(self.entries.pop(episodeid)['outputs'])
+            self.changed = True
+        return outputs
+
+    # Return True if path is an output of any episode
+    def isOutput(self, path):
+        return any(path in entry['outputs'] for entry in self.entries.values())
+
+    def relpath(self, path):
+        return os.path.relpath(path, self.folder)
+
+    def abspath(self, path):
+        return os.path.normpath(os.path.join(self.folder, path))
+
+    def setOrphans(self, orphans):
+        if orphans != self.orphans:
+            self.orphans = orphans
+            self.changed = True
+
+    # Record the outputs of entry, given a dictionary of absolute path: stamp
+    def setOutputs(self, entry, outputs):
+        entry['outputs'] = { self.relpath(path): stamp for path, stamp in outputs.items() }
+
+    # Return True if the outputs in entry still exist, with the content they were generated with
+    def outputsUnchanged(self, entry):
+        for path, previous in entry['outputs'].items():
+            stamp = Stamp(self.abspath(path), previous)
+            if stamp is None or stamp['hash'] != previous['hash']:
+                return False
+            if stamp is not previous:
+                # Only the mtime changed, so record it to skip hashing next time
+                entry['outputs'][path] = stamp
+                self.changed = True
+        return True
+
+    def load(self):
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, mode='r', encoding='utf-8') as file:
+                    manifest = json.load(file)
+                if manifest.get('version') == self.version:
+                    self.entries = manifest['episodes']
+                    self.orphans = manifest['orphans']
+            except Exception as error:
+                print(f"Error reading the build manifest ({type(error).__name__}): {error}")
+
+    def save(self):
+        if self.changed:
+            writeJson(self.path, { 'version': self.version, 'episodes': self.entries, 'orphans': self.orphans })
+            self.changed = False
+
+# Get the stamp of the file at path, or None if it doesn't exist
+# previous is the last stamp of the file, whose hash is reused if the file's size and mtime haven't changed
+def Stamp(path, previous=None):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+        return previous
+    return { 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': HashFile(path) }
+
+def HashFile(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Hash the settings that affect the output, using a canonical JSON encoding
+def HashSettings(settings):
+    return hashlib.blake2b(json.dumps(settings, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
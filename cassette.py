@@ -0,0 +1,177 @@
+import io
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import urllib3
+
+from episodestore import writeJson
+
+# Records the responses to network requests, so an import can later be replayed from them without the network.
+# Enabled by the test setting: "save" makes the real requests and records the responses, "load" replays them.
+# Each response is recorded in <test-path>/cassette/<kind>/, in files named after a hash of the request:
+#   <hash>.json     the request, and the response's status, headers and any other details
+#   <hash>.body     the response body, if it has one
+# The kinds are http (Fetcher.HttpRequest), s3 (the S3 client) and youtube (YouTubeAPI.execute).
+# Responses are always recorded in full. Conditional requests are then answered from the recording as the server would,
+# so replaying with the validators saved by an earlier replay skips the unchanged sources, just as it would online.
+class Cassette():
+    def __init__(self, folder, mode):
+        self.folder = folder
+        self.mode = mode
+
+    # True if requests are made for real and recorded, False if they are replayed
+    def recording(self):
+        return self.mode == 'save'
+
+    # Get the path of the recording of request, without the extension
+    # request is a dictionary that identifies the request, e.g. { method, url }
+    def path(self, kind, request):
+        digest = hashlib.blake2b(json.dumps(request, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.folder, kind, digest)
+
+    # Get the recorded response to request, or None if it wasn't recorded
+    def load(self, kind, request):
+        path = self.path(kind, request) + '.json'
+        if not os.path.isfile(path):
+            description = json.dumps(request, sort_keys=True)
+            print(f"No recorded {kind} response to {description if len(description) <= 200 else description[:200] + '...'}")
+            return None
+        with open(path, mode='r', encoding='utf-8') as file:
+            return json.load(file)['response']
+
+    # Open the recorded body of the response to request, or return None if it doesn't have one
+    def openBody(self, kind, request):
+        path = self.path(kind, request) + '.body'
+        return open(path, 'rb') if os.path.isfile(path) else None
+
+    # Record the response to request, and its body, if given as a binary stream
+    def save(self, kind, request, response, body=None):
+        path = self.path(kind, request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if body is not None:
+            temppath = path + '.body.tmp'
+            with open(temppath, 'wb') as file:
+                shutil.copyfileobj(body, file, 1024 * 1024)
+            os.replace(temppath, path + '.body')
+        writeJson(path + '.json', { 'request': request, 'response': response })
+
+# Return True if a response with the given headers hasn't been modified since the validators in the conditional request headers
+def NotModified(requestHeaders, responseHeaders):
+    # If-None-Match takes precedence, as it does for servers
+    if 'If-None-Match' in requestHeaders:
+        return requestHeaders['If-None-Match'] == responseHeaders.get('ETag')
+    if 'If-Modified-Since' in requestHeaders and 'Last-Modified' in responseHeaders:
+        try:
+            return parsedate_to_datetime(responseHeaders['Last-Modified']) <= parsedate_to_datetime(requestHeaders['If-Modified-Since'])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# Makes the requests of Fetcher.HttpRequest through a cassette, in place of a urllib3 PoolManager
+# The responses are urllib3 responses reading from the recorded body, so the fetchers handle them as usual
+class CassetteHttp():
+    # Only the headers the fetchers use are recorded. The body is recorded decoded, so Content-Encoding isn't one of them.
+    recordedHeaders = ('Content-Type', 'ETag', 'Last-Modified')
+
+    def __init__(self, cassette, http):
+        self.cassette = cassette
+        self.http = http
+
+    def request(self, method, url, headers=None, preload_content=False):
+        request = { 'method': method, 'url': url }
+        if self.cassette.recording():
+            # Unconditional, so the whole response is recorded whatever the validators are
+            r = self.http.request(method, url, preload_content=False)
+            response = { 'status': r.status, 'headers': { name: r.headers[name] for name in self.recordedHeaders if name in r.headers } }
+            self.cassette.save('http', request, response, r)
+            r.release_conn()
+        else:
+            response = self.cassette.load('http', request)
+            if response is None:
+                response = { 'status': 404, 'headers': {} }
+
+        if response['status'] == 200 and headers and NotModified(headers, response['headers']):
+            return urllib3.response.HTTPResponse(body=io.BytesIO(), headers=response['headers'], status=304, preload_content=False)
+        body = self.cassette.openBody('http', request)
+        return urllib3.response.HTTPResponse(body=body or io.BytesIO(), headers=response['headers'], status=response['status'], preload_content=False)
+
+# Makes the calls the fetchers use of a boto3 S3 client through a cassette
+# client is the real client, which is only needed when recording
+class CassetteS3():
+    def __init__(self, cassette, client):
+        self.cassette = cassette
+        self.client = client
+
+    def get_paginator(self, operation):
+        return CassetteS3Paginator(self, operation)
+
+    # The pages are recorded whole, with only the objects' details, so the listing is replayed in the same order
+    def paginate(self, operation, params):
+        request = { 'operation': operation, 'params': params }
+        if self.cassette.recording():
+            pages = []
+            for page in self.client.get_paginator(operation).paginate(**params):
+                pages.append({ 'Contents': [
+                    { name: value.isoformat() if isinstance(value, datetime) else value for name, value in o.items() }
+                    for o in page.get('Contents', [])
+                ] })
+            self.cassette.save('s3', request, { 'pages': pages })
+        else:
+            response = self.cassette.load('s3', request)
+            pages = response['pages'] if response else []
+        for page in pages:
+            for o in page['Contents']:
+                if isinstance(o.get('LastModified'), str):
+                    o['LastModified'] = datetime.fromisoformat(o['LastModified'])
+        return pages
+
+    def download_file(self, Bucket, Key, Filename):
+        request = { 'operation': 'get_object', 'params': { 'Bucket': Bucket, 'Key': Key } }
+        if self.cassette.recording():
+            self.client.download_file(Bucket, Key, Filename)
+            with open(Filename, 'rb') as body:
+                self.cassette.save('s3', request, {}, body)
+            return
+
+        body = self.cassette.openBody('s3', request)
+        if body is None:
+            raise FileNotFoundError(f"No recorded download of s3://{Bucket}/{Key}")
+        with body, open(Filename, 'wb') as file:
+            shutil.copyfileobj(body, file, 1024 * 1024)
+
+    # When replaying, nothing is deleted, so the next replay lists the same objects
+    def delete_objects(self, Bucket, Delete):
+        request = { 'operation': 'delete_objects', 'params': { 'Bucket': Bucket, 'Delete': Delete } }
+        if self.cassette.recording():
+            response = self.client.delete_objects(Bucket=Bucket, Delete=Delete)
+            response = { 'Errors': response.get('Errors', []) }
+            self.cassette.save('s3', request, response)
+            return response
+        return self.cassette.load('s3', request) or {}
+
+    # When replaying, nothing is uploaded
+    def upload_file(self, Filename, Bucket, Key):
+        if self.cassette.recording():
+            self.client.upload_file(Filename, Bucket, Key)
+        else:
+            print(f"Not uploading {Filename} to s3://{Bucket}/{Key} while replaying")
+
+class CassetteS3Paginator():
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, **params):
+        return self.client.paginate(self.operation, params)
+
+# The cassette is shared by all fetchers in the process, and is None if the test setting isn't set
+cassette = None
+
+def getCassette(config):
+    global cassette
+    if cassette is None and 'test' in config:
+        cassette = Cassette(os.path.join(config['test-path'], 'cassette'), config['test'])
+    return cassette
@@ -3,114 +3,257 @@ import argparse
 import datetime
 import sys
 import json
+import io
+import contextlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 # import tscribe - No! No! Noooo! Very very sloooow!
 import webvttUtils
-from transcripttotext import transcriptToText
+from transcripttotext import transcriptToText, EpisodeOverrides
+from transcript import loadTranscript
+from buildmanifest import BuildManifest, Stamp, HashSettings
+from metrics import getMetrics
+
+# Increase when a change to the code changes the pages or captions, so they are all rebuilt
+rendererVersion = 1
+
+# Config settings that only change the pages and captions of episodes with a transcript
+transcriptSettings = ('ums', 'transcript-disclaimer', 'caption-limits')
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
-def GeneratePage(episodepath, config):
+# Get the paths of the files generated for an episode: the page, the captions, and the transcript they are generated from
+def PagePaths(dataDict, config):
+    pagepath = os.path.join(config['page-folder'], dataDict['filename'] + '.md')
+    transcriptPath = os.path.join(config['episode-folder'], dataDict['episodeid'], 'transcript.json')
+    vttpath = os.path.join(config['vtt-folder'], dataDict['episodeid'] + '.vtt')
+    return pagepath, transcriptPath, vttpath
+
+# Hash the settings that the episode's page and captions are generated with
+# The settings for transcripts, including the speakers in the episode specific config, are only included if the episode has a transcript,
+# so changing them doesn't rebuild the pages of episodes without one
+def SettingsHash(episodeid, config, overrides, hasTranscript):
+    settings = { 'renderer': rendererVersion }
+    if hasTranscript:
+        settings.update({ key: config[key] for key in transcriptSettings if key in config })
+        settings['interviewer'] = config['defaults']['interviewer'] if 'defaults' in config and 'interviewer' in config['defaults'] else None
+        settings['episode'] = overrides.get(episodeid)
+    return HashSettings(settings)
+
+# Get whether the episode's page needs to be created (-1), updated (1) or neither (0), the episode data, and its new manifest entry
+# The page is up to date if the content of its inputs and the settings are the same as when it was last written, and it hasn't been changed since.
+# The episode data is only read if the page needs to be written.
+def CheckPage(episodeid, config, manifest, overrides):
+    episodepath = os.path.join(config['episode-folder'], episodeid, 'episode.json')
+    transcriptPath = os.path.join(config['episode-folder'], episodeid, 'transcript.json')
+
+    previous = manifest.get(episodeid)
+    inputs = {
+        'episode': Stamp(episodepath, previous['inputs']['episode'] if previous else None),
+        'transcript': Stamp(transcriptPath, previous['inputs']['transcript'] if previous else None)
+    }
+    entry = {
+        'inputs': inputs,
+        'config': SettingsHash(episodeid, config, overrides, inputs['transcript'] is not None),
+        'outputs': dict(previous['outputs']) if previous else {}
+    }
+    if previous \
+            and all(
+                (entry['inputs'][name] and entry['inputs'][name]['hash']) == (previous['inputs'][name] and previous['inputs'][name]['hash'])
+                for name in ('episode', 'transcript')
+            ) \
+            and entry['config'] == previous['config'] \
+            and manifest.outputsUnchanged(entry):
+        # The episode data has not changed
+        return 0, None, entry
+
     # Get the episode data
     with open(episodepath, 'r', encoding='utf-8') as file:
         dataDict = json.load(file)
-        file.close()
 
-    # Does the page need to be created or updated?
-    pagepath = os.path.join(config['page-folder'], dataDict['filename'] + '.md')
-    transcriptPath = os.path.join(config['episode-folder'], dataDict['episodeid'], 'transcript.json')
-    vttpath = os.path.join(config['vtt-folder'], dataDict['episodeid'] + '.vtt')
+    pagepath, transcriptPath, vttpath = PagePaths(dataDict, config)
     if os.path.exists(pagepath):
-        # The page exists. Does it need to be updated?
-        pageModified = os.path.getmtime(pagepath)
-        # If either the episode data or transcript data has changed?
-        dataModified = max(
-            os.path.getmtime(transcriptPath) if os.path.exists(transcriptPath) else 0,
-            os.path.getmtime(episodepath)
-        )
-        if dataModified > pageModified:
-            writePage = 1   # The episode data has changed, so the page needs to be updated
-        else:
-            writePage = 0   # The episode data has not changed
+        writePage = 1   # The episode data has changed, so the page needs to be updated
     else:
-        writePage = -1      # The episode data is new, so the page needs to be created
-
-    if writePage:
-        if os.path.exists(transcriptPath):
-            print('Writing captions to ' + vttpath)
-            # tscribe.write(transcriptPath, format="vtt", save_as=vttpath)
-            webvttUtils.writeTranscriptToWebVTT(transcriptPath, 'en', vttpath)
-            dataDict["vtt"] = dataDict['episodeid'] + '.vtt'
-
-        if 'published' in dataDict:
-            # Convert datetime to date
-            # dataDict['publishDate'] = datetime.datetime.strptime(dataDict['published'], "%Y-%m-%d")
-            dataDict['publishDate'] = dataDict["published"]
-        if "spotifyAudioUrl" in dataDict:
-            dataDict["audiourl"] = dataDict["spotifyAudioUrl"]
-
-        print(('Creating' if writePage < 0 else 'Updating') + ' ' + pagepath)
-        # Select fields to write to the FrontMatter section, if they exist for this episode
-        episodeDict = { key: dataDict[key] for key in ('title', 'episodeid', 'publishDate', 'excerpt', 'youtubeid', 'audiourl', 'image', 'tags', 'itunesEpisodeUrl', 'spotifyEpisodeUrl', 'transcript', 'vtt') if key in dataDict }
-        episodeDict['draft'] = False
-
-        with open(pagepath, 'w', encoding='utf-8') as file:
-            file.write('---\n')
-            json.dump(episodeDict, file, indent='\t')
-            file.write('\n---\n')
-
-            # <div> tags require 2 line breaks, otherwise the next line's markup is not processed
-            if not os.path.exists(transcriptPath):
-                file.write('<div class="timelinks">\n\n')
-                file.write(dataDict['shownotes'])
-                file.write('</div>\n\n')
-            else:
-                file.write('<a name="top"></a>[Jump to transcript](#transcript)\n')
-                file.write('## Show notes\n')
-                file.write('<div class="timelinks">\n\n')
-                file.write(dataDict['shownotes'])
-                file.write('</div>\n\n')
-                file.write('[Back to top](#top)\n')
-                file.write('<a name="transcript"></a>\n')
-                file.write('## Transcript\n')
-                file.write('<div class="timelinks">\n\n')
-                if 'transcript-disclaimer' in config:
-                    file.write(config['transcript-disclaimer'])
-                transcriptToText(transcriptPath, dataDict, config, file)
-                file.write('</div>\n\n')
-                file.write('[Back to top](#top)\n')
-
-    return writePage
-
-def GeneratePages(config):
-    createdCount = 0
-    updatedCount = 0
-
-    print(f"Generating pages from {config['episode-folder']} to {config['page-folder']}")
-    with os.scandir(config['episode-folder']) as episodes:
-        for episode in episodes:
-            episodepath = os.path.join(config['episode-folder'], episode.name, 'episode.json')
-            # os.episode.name.endswith('.yaml')
-            if os.path.exists(episodepath):
-                writePage = GeneratePage(episodepath, config)
-                if writePage < 0:
-                    createdCount += 1
-                elif writePage > 0:
-                    updatedCount += 1
-                # else: Unchanged
+        writePage = -1  # The episode data is new, so the page needs to be created
+
+    return writePage, dataDict, entry
+
+# overrides is the episode specific config, from EpisodeOverrides
+# Returns the paths of the files written
+def WritePage(dataDict, writePage, config, overrides):
+    pagepath, transcriptPath, vttpath = PagePaths(dataDict, config)
+    # The transcript is decoded once, for both the captions and the page
+    # The decoded transcript is cached in transcript.bin, unless "transcript-cache" is false
+    transcript = loadTranscript(transcriptPath, config['transcript-cache'] if 'transcript-cache' in config else True) \
+        if os.path.exists(transcriptPath) else None
+    # A transcript of no items is false, as its length is 0, so test for None
+    if transcript is not None:
+        print('Writing captions to ' + vttpath)
+        # tscribe.write(transcriptPath, format="vtt", save_as=vttpath)
+        webvttUtils.writeTranscriptToWebVTT(transcript, 'en', vttpath, config['caption-limits'] if 'caption-limits' in config else None)
+        dataDict["vtt"] = dataDict['episodeid'] + '.vtt'
+        outputs = [pagepath, vttpath]
+    else:
+        outputs = [pagepath]
+
+    if 'published' in dataDict:
+        # Convert datetime to date
+        # dataDict['publishDate'] = datetime.datetime.strptime(dataDict['published'], "%Y-%m-%d")
+        dataDict['publishDate'] = dataDict["published"]
+    if "spotifyAudioUrl" in dataDict:
+        dataDict["audiourl"] = dataDict["spotifyAudioUrl"]
+
+    print(('Creating' if writePage < 0 else 'Updating') + ' ' + pagepath)
+    # Select fields to write to the FrontMatter section, if they exist for this episode
+    episodeDict = { key: dataDict[key] for key in ('title', 'episodeid', 'publishDate', 'excerpt', 'youtubeid', 'audiourl', 'image', 'tags', 'itunesEpisodeUrl', 'spotifyEpisodeUrl', 'transcript', 'vtt') if key in dataDict }
+    episodeDict['draft'] = False
+
+    with open(pagepath, 'w', encoding='utf-8') as file:
+        file.write('---\n')
+        json.dump(episodeDict, file, indent='\t')
+        file.write('\n---\n')
+
+        # <div> tags require 2 line breaks, otherwise the next line's markup is not processed
+        if transcript is None:
+            file.write('<div class="timelinks">\n\n')
+            file.write(dataDict['shownotes'])
+            file.write('</div>\n\n')
+        else:
+            file.write('<a name="top"></a>[Jump to transcript](#transcript)\n')
+            file.write('## Show notes\n')
+            file.write('<div class="timelinks">\n\n')
+            file.write(dataDict['shownotes'])
+            file.write('</div>\n\n')
+            file.write('[Back to top](#top)\n')
+            file.write('<a name="transcript"></a>\n')
+            file.write('## Transcript\n')
+            file.write('<div class="timelinks">\n\n')
+            if 'transcript-disclaimer' in config:
+                file.write(config['transcript-disclaimer'])
+            transcriptToText(transcript, dataDict, config, file, overrides)
+            file.write('</div>\n\n')
+            file.write('[Back to top](#top)\n')
+
+    return outputs
+
+# Write the page, and return the stamps of the files written, for its manifest entry
+def WritePageOutputs(dataDict, writePage, config, overrides):
+    with getMetrics().span('page.write'):
+        return { path: Stamp(path) for path in WritePage(dataDict, writePage, config, overrides) }
+
+# Write a page in a worker process, capturing its output so the parent can print it in order
+# Returns the output, the stamps of the files written, and the metrics of the job, for the parent to merge
+def WritePageJob(dataDict, writePage, config, overrides):
+    metrics = getMetrics()
+    # Drop the metrics the worker inherited from the parent, or recorded since its last job
+    metrics.take()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        outputs = WritePageOutputs(dataDict, writePage, config, overrides)
+    return output.getvalue(), outputs, metrics.take()
+
+# Remove the files that were generated for episodes that have been renamed or deleted, or only report them if keepOrphans
+# orphans are paths relative to the manifest. Orphans kept by earlier runs are included, so they can be removed later.
+def RemoveOrphans(manifest, orphans, keepOrphans):
+    count = 0
+    kept = []
+    for path in sorted(set(orphans + manifest.orphans)):
+        # Another episode may now have the same page, e.g. if 2 episodes swapped titles
+        if manifest.isOutput(path) or not os.path.exists(manifest.abspath(path)):
+            continue
+        count += 1
+        getMetrics().count('pages.orphans')
+        if keepOrphans:
+            print('Orphaned ' + manifest.abspath(path))
+            kept.append(path)
+        else:
+            print('Removing ' + manifest.abspath(path))
+            os.remove(manifest.abspath(path))
+    manifest.setOrphans(kept)
+    if count > 0:
+        print(str(count) + (' orphaned files found' if keepOrphans else ' orphaned files removed'))
+
+# With jobs > 1, the pages that need to be written are written by a pool of processes
+# Files generated for episodes that no longer exist, or have been renamed, are removed, unless keepOrphans
+def GeneratePages(config, jobs=1, keepOrphans=False):
+    metrics = getMetrics()
+    with metrics.span('page.generate'):
+        createdCount = 0
+        updatedCount = 0
+
+        print(f"Generating pages from {config['episode-folder']} to {config['page-folder']}")
+        # The episode specific config is indexed once, and passed to each page, including those written by other processes
+        overrides = EpisodeOverrides(config)
+        manifest = BuildManifest(config['build-manifest'])
+        # List of (episode data, writePage) for the pages that need to be written, and their manifest entries
+        stale = []
+        entries = []
+        # The episodes found, and the files no longer generated for them
+        episodeids = set()
+        orphans = []
+        with os.scandir(config['episode-folder']) as episodes:
+            # Sort so the output is in the same order on every run
+            for episode in sorted(episodes, key=lambda episode: episode.name):
+                episodepath = os.path.join(config['episode-folder'], episode.name, 'episode.json')
+                # os.episode.name.endswith('.yaml')
+                if os.path.exists(episodepath):
+                    episodeids.add(episode.name)
+                    with metrics.span('page.check'):
+                        writePage, dataDict, entry = CheckPage(episode.name, config, manifest, overrides)
+                    if writePage:
+                        stale.append((dataDict, writePage))
+                        entries.append((episode.name, entry))
+                    else:
+                        manifest.update(episode.name, entry)
+                    if writePage < 0:
+                        createdCount += 1
+                    elif writePage > 0:
+                        updatedCount += 1
+                    # else: Unchanged
+                else:
+                    print(f"WARNING: Missing episode file {episodepath}")
+
+        # The manifest is saved even if writing a page fails, to keep the entries of the pages that were written
+        try:
+            if jobs > 1 and len(stale) > 1:
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    # map returns the results in order, whichever process finishes first
+                    results = executor.map(WritePageJob, *zip(*stale), itertools.repeat(config), itertools.repeat(overrides))
+                    for (episodeid, entry), (output, outputs, jobMetrics) in zip(entries, results):
+                        print(output, end='')
+                        metrics.merge(jobMetrics)
+                        manifest.setOutputs(entry, outputs)
+                        orphans.extend(manifest.update(episodeid, entry))
             else:
-                print(f"WARNING: Missing episode file {episodepath}")
-    if createdCount > 0:
-        print(str(createdCount) + ' pages created' )
-    if updatedCount > 0:
-        print(str(updatedCount) + ' pages updated' )
-    if createdCount == 0 and updatedCount == 0:
-        print('No pages needed to be created or updated' )
+                for (dataDict, writePage), (episodeid, entry) in zip(stale, entries):
+                    manifest.setOutputs(entry, WritePageOutputs(dataDict, writePage, config, overrides))
+                    orphans.extend(manifest.update(episodeid, entry))
+            orphans.extend(manifest.removeOthers(episodeids))
+        finally:
+            RemoveOrphans(manifest, orphans, keepOrphans)
+            manifest.save()
+
+        metrics.count('pages.created', createdCount)
+        metrics.count('pages.updated', updatedCount)
+        metrics.count('pages.unchanged', len(episodeids) - createdCount - updatedCount)
+        if createdCount > 0:
+            print(str(createdCount) + ' pages created' )
+        if updatedCount > 0:
+            print(str(updatedCount) + ' pages updated' )
+        if createdCount == 0 and updatedCount == 0:
+            print('No pages needed to be created or updated' )
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', '--configfile')
     parser.add_argument('-x', '--ignore')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    # Report the pages and captions of renamed and deleted episodes, rather than removing them
+    parser.add_argument('--keep-orphans', action='store_true')
+    # Write the timings and counters of the run to this JSON file
+    parser.add_argument('--metrics-out')
     args = parser.parse_args()
 
     configpath = args.configfile if args.configfile else 'incharge-podcaster.json'
@@ -137,7 +280,16 @@ def main():
     if not os.path.exists(config['vtt-folder']):
         os.makedirs(config['vtt-folder'])
 
-    GeneratePages(config)
+    # Records what each page was generated from, so only pages whose content would change are written
+    config['build-manifest'] = os.path.abspath(
+        config['build-manifest'] if 'build-manifest' in config else os.path.join(config['page-folder'], '.build-manifest.json')
+    )
+
+    try:
+        GeneratePages(config, args.jobs, args.keep_orphans)
+    finally:
+        if args.metrics_out:
+            getMetrics().save(args.metrics_out, 'createpages')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os
+import copy
+import json
+
+# Holds the episode data files in memory for the duration of an import.
+# Each data file is read at most once, and only the episodes that changed are written, when flush is called.
+# It also holds the fingerprints of the feed items that each source's episodes were last derived from.
+class EpisodeStore():
+    def __init__(self, folder, fingerprintPath):
+        self.folder = folder
+        # Dictionary of episodeid: episode data, or None if the episode has no data file
+        self.episodes = {}
+        # episodeids of the episodes that need to be written
+        self.dirty = set()
+        self.fingerprintPath = fingerprintPath
+        # Dictionary of source key: { episodeid: fingerprint }
+        self.fingerprints = {}
+        self.fingerprintsChanged = False
+        self.loadFingerprints()
+
+    def path(self, episodeid):
+        return os.path.join(self.folder, episodeid, 'episode.json')
+
+    # Return the data of the episode, or None if it doesn't exist
+    def get(self, episodeid):
+        if episodeid not in self.episodes:
+            path = self.path(episodeid)
+            if os.path.isfile(path):
+                with open(path, 'r', encoding='utf-8') as file:
+                    self.episodes[episodeid] = json.load(file)
+            else:
+                self.episodes[episodeid] = None
+        return self.episodes[episodeid]
+
+    # Return True if the episode has a data file, without reading it
+    def exists(self, episodeid):
+        if episodeid in self.episodes:
+            return self.episodes[episodeid] is not None
+        return os.path.isfile(self.path(episodeid))
+
+    # Return True if the source's item for the episode has the same fingerprint as when the episode was last imported from it,
+    # and no other source has changed the episode during this import, so importing the item again would change nothing
+    def unchanged(self, sourceKey, episodeid, fingerprint):
+        return self.fingerprints.get(sourceKey, {}).get(episodeid) == fingerprint \
+            and episodeid not in self.dirty \
+            and self.exists(episodeid)
+
+    def setFingerprint(self, sourceKey, episodeid, fingerprint):
+        fingerprints = self.fingerprints.setdefault(sourceKey, {})
+        if fingerprints.get(episodeid) != fingerprint:
+            fingerprints[episodeid] = fingerprint
+            self.fingerprintsChanged = True
+
+    # Replace the data of the episode
+    # A copy is stored, so the caller can continue to modify episode
+    def put(self, episode):
+        self.episodes[episode['episodeid']] = copy.deepcopy(episode)
+        self.dirty.add(episode['episodeid'])
+
+    # Write the changed episodes to their data files, and return how many were written
+    def flush(self):
+        for episodeid in sorted(self.dirty):
+            path = self.path(episodeid)
+            folder = os.path.dirname(path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            writeJson(path, self.episodes[episodeid])
+
+        # Fingerprints are saved after the episodes, so they never refer to data that wasn't written
+        if self.fingerprintsChanged:
+            writeJson(self.fingerprintPath, self.fingerprints)
+            self.fingerprintsChanged = False
+
+        count = len(self.dirty)
+        self.dirty.clear()
+        return count
+
+    def loadFingerprints(self):
+        if os.path.isfile(self.fingerprintPath):
+            try:
+                with open(self.fingerprintPath, mode='r', encoding='utf-8') as file:
+                    self.fingerprints = json.load(file)
+            except Exception as error:
+                print(f"Error reading the fingerprint file ({type(error).__name__}): {error}")
+
+# Write data to a temporary file and rename it to path, so the file is never left half written
+def writeJson(path, data):
+    temppath = path + '.tmp'
+    with open(temppath, 'w', encoding='utf-8') as file:
+        json.dump(data, file, indent='\t')
+    os.replace(temppath, path)
+
+# The store is shared by all fetchers in the process
+episodeStore = None
+
+def getEpisodeStore(config):
+    global episodeStore
+    if episodeStore is None:
+        episodeStore = EpisodeStore(
+            config['episode-folder'],
+            config['fingerprint-cache'] if 'fingerprint-cache' in config else 'fingerprints.json'
+        )
+    return episodeStore
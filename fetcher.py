@@ -1,43 +1,99 @@
-import os
+import io
 import re
+import json
+import hashlib
 from datetime import datetime
 from abc import ABC, abstractmethod
 import urllib3
-import json
 import xml.etree.ElementTree as et # See https://docs.python.org/3/library/xml.etree.elementtree.html
 
+from httpcache import getHttpCache
+from episodestore import getEpisodeStore
+from shownotes import getShownotesCleaner
+from cassette import getCassette, CassetteHttp
+from metrics import getMetrics
+
+# One connection pool shared by every fetcher, so downloads from the same host reuse their connections
+http = urllib3.PoolManager()
+
+# Increase when a change to the code changes the episode data derived from feed items, so every item is imported again
+derivationVersion = 1
+
 class Fetcher(ABC):
     def __init__(self, config):
         self.config = config
-
+        self.httpCache = getHttpCache(config)
+        self.episodeStore = getEpisodeStore(config)
+        self.textCleaner = getShownotesCleaner('text', config)
+        self.htmlCleaner = getShownotesCleaner('html', config)
+        self.sourceKey = None
+        # The urls downloaded with conditional requests, whose validators were stored
+        self.conditionalUrls = []
+        # In test mode, requests are recorded to or replayed from the cassette instead
+        cassette = getCassette(config)
+        self.http = CassetteHttp(cassette, http) if cassette else http
+
+    # Download the source's network payload, which is passed to fetch.
+    # Sources are downloaded concurrently, so this must not update any episode data.
+    # Return None if there is nothing to process.
+    def download(self, source):
+        return None
+
+    # Extract the episodes from the downloaded payload and update the episode data files.
+    # Sources are fetched one at a time, primary sources first.
     @abstractmethod
-    def fetch(self, source):
+    def fetch(self, source, payload):
         pass
 
-    # Return True if the download succeeds
-    def HttpDownload(self, url, path):
-        chunk_size = 1024 * 1024
-
-        http = urllib3.PoolManager()
-        r = http.request('GET', url, preload_content=False)
-        success = r.status == 200
-        if success:
-            print('Downloading from ' + url + ' to ' + path)
-            with open(path, 'wb') as out:
-                while True:
-                    data = r.read(chunk_size)
-                    if not data:
-                        break
-                    out.write(data)
-            r.release_conn()
+    # Make a GET request and return the response, with its body not yet read, or None if the request fails
+    # If conditional is True, then the request is only made if the url has changed since it was last downloaded,
+    # and None is returned if it hasn't changed. Validators are only stored for conditional requests,
+    # so one-off downloads, e.g. audio files, don't fill the cache.
+    def HttpRequest(self, url, conditional=False):
+        headers = self.httpCache.headers(url) if conditional else {}
+        metrics = getMetrics()
+        with metrics.span('http.request'):
+            r = self.http.request('GET', url, headers=headers, preload_content=False)
+        metrics.count('http.requests')
+        if r.status == 200:
+            if conditional:
+                self.httpCache.update(url, r.headers)
+                self.conditionalUrls.append(url)
+            return r
+
+        if r.status == 304:
+            metrics.count('http.not-modified')
+            print('Not modified since the last download from ' + url)
         else:
+            metrics.count('http.errors')
             print('HTTP request status ' + str(r.status) + ' from url ' + url)
-        return success
+        r.drain_conn()
+        return None
 
-    def HttpDownloadRss(self, url, rsspath):
+    # Return True if the download succeeds
+    # If conditional is True, then False is also returned if the url hasn't changed since it was last downloaded
+    def HttpDownload(self, url, path, conditional=False):
+        chunk_size = 1024 * 1024
+
+        metrics = getMetrics()
+        with metrics.span('http.download'):
+            r = self.HttpRequest(url, conditional)
+            if r is not None:
+                print('Downloading from ' + url + ' to ' + path)
+                with open(path, 'wb') as out:
+                    while True:
+                        data = r.read(chunk_size)
+                        if not data:
+                            break
+                        out.write(data)
+                        metrics.count('http.bytes', len(data))
+                r.release_conn()
+        return r is not None
+
+    def HttpDownloadRss(self, url, rsspath, conditional=False):
         if re.match(r"^https?://", url):
             print("Download from RSS " + url)
-            if not self.HttpDownload(url, rsspath):
+            if not self.HttpDownload(url, rsspath, conditional):
                 rsspath = None
         else:
             rsspath = url
@@ -45,6 +101,55 @@ class Fetcher(ABC):
 
         return rsspath
 
+    # Open a feed for reading, and return a binary stream, or None if it isn't available
+    # url is either an http(s) url or the path of a local file.
+    # This is called from download, so the whole response body is read here, while the other sources download,
+    # rather than being left open until the feed is fetched. It is held in memory, so nothing is written to disk.
+    # If the source sets "stream": false then the feed is downloaded to filename instead.
+    # The stream must be closed with CloseFeed.
+    def OpenFeed(self, url, filename, source):
+        conditional = source['only-new']
+        if 'stream' in source and not source['stream']:
+            path = self.HttpDownloadRss(url, filename, conditional)
+            return open(path, 'rb') if path else None
+
+        if re.match(r"^https?://", url):
+            print("Downloading feed " + url)
+            metrics = getMetrics()
+            with metrics.span('http.download'):
+                r = self.HttpRequest(url, conditional)
+                if r is None:
+                    return None
+                data = r.read()
+                r.release_conn()
+            metrics.count('http.bytes', len(data))
+            return io.BytesIO(data)
+
+        print("Process local feed file " + url)
+        return open(url, 'rb')
+
+    def CloseFeed(self, stream):
+        stream.close()
+
+    # Yield each element with the given tag from the XML in a binary stream, as soon as the element has been parsed.
+    # Each element is discarded once the caller has processed it, and the stream is only read
+    # as far as the caller iterates, so a loop that breaks early doesn't parse the rest of the feed.
+    # Use Clark notation for namespaced tags, e.g. {http://www.w3.org/2005/Atom}entry
+    def IterElements(self, stream, tag):
+        # Elements which have started but not ended, so the parent of each element is known when it ends
+        parents = []
+        for event, element in et.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+            else:
+                parents.pop()
+                if element.tag == tag:
+                    yield element
+                    # Free the processed element, so memory use doesn't grow with the size of the feed
+                    element.clear()
+                    if parents:
+                        parents[-1].remove(element)
+
     # See regex docs
     # https://docs.python.org/3/library/re.html#re.Match.group
     # https://docs.python.org/3/library/re.html#re.sub
@@ -75,63 +180,15 @@ class Fetcher(ABC):
 
         return speakers
 
+    # Clean up plain text shownotes, e.g. from YouTube
     def TrimShownotes(self, shownotes):
-        # Remove 'Support the channel'
-        # 950+
-        shownotes = re.sub(r"^[\*\-]+Support the channel[\*\-]+$.*enlites\.com/\n", '', shownotes, flags=re.DOTALL | re.MULTILINE)
-        # 426-949
-        shownotes = re.sub(r"------------------Support the channel------------.*enlites\.com/\n", '', shownotes, flags=re.DOTALL)
-        # Up to 167-391
-        shownotes = re.sub(r"------------------Support the channel------------.*anchor\.fm/thedissenter\n", '', shownotes, flags=re.DOTALL)
-        # 1-145, 392-425
-        shownotes = re.sub(r"------------------Support the channel------------.*twitter\.com/TheDissenterYT\n", '', shownotes, flags=re.DOTALL)
-
-        # Remove whitespace from the start
-        shownotes = re.sub(r'^[\n]*', '', shownotes)
-
-        # Remove credits from the end
-        shownotes = re.sub(r'[-]*\nA HUGE THANK YOU.*$', '', shownotes, flags=re.DOTALL)
-
-        # Horizontal rules
-        shownotes = re.sub(r'\n *-[-]+ *\n', '\n\n---\n\n', shownotes)
-
-        # Add 2 spaces before single lime breaks, so they don't wrap
-        shownotes = re.sub(r'([^\n])\n([^\n])', r'\1  \n\2', shownotes)
-
-		# Wrap Time Links in time tags
-        shownotes = re.sub(r"^(([0-9]{1,2}:)?[0-9]{2}:[0-9]{2}) *(.*)$", r"<time>\1</time> \3", shownotes, flags=re.MULTILINE)
-
-        # print('Trimmed shownotes: ', shownotes)
-        return shownotes
+        with getMetrics().span('shownotes.clean'):
+            return self.textCleaner.clean(shownotes)
 
+    # Clean up HTML shownotes, e.g. from Spotify or iTunes
     def TrimShownotesHtml(self, shownotes):
-        # Remove 'Support the channel'
-        # 950+
-        shownotes = re.sub(r"<p>[\*\-]+Support the channel[\*\-]+</p>.*enlites\.com/</a></p>\n", '', shownotes, flags=re.DOTALL)
-        # 426 to 949
-        shownotes = re.sub(r"<p>------------------Support the channel------------</p>.*enlites\.com/</a></p>\n", '', shownotes, flags=re.DOTALL)
-        # Up to 167-391
-        shownotes = re.sub(r"<p>------------------Support the channel------------</p>.*anchor\.fm/thedissenter</a></p>\n", '', shownotes, flags=re.DOTALL)
-        # 1-145, 392-425
-        shownotes = re.sub(r"<p>------------------Support the channel------------</p>.*twitter\.com/TheDissenterYT</a></p>\n", '', shownotes, flags=re.DOTALL)
-
-        # Remove blank lines from the start
-        # \xA0 is utf-8 non-breaking-space
-        shownotes = re.sub(r"^<p>[ -\xA0]*</p>\n", '', shownotes)
-        shownotes = re.sub(r"^<p><br></p>\n", '', shownotes)
-        shownotes = re.sub(r"^\n", '', shownotes)
-
-        # Remove credits from the end
-        shownotes = re.sub(r'<p><a href="">A HUGE THANK YOU.*$', '', shownotes, flags=re.DOTALL)
-        shownotes = re.sub(r'<p>A HUGE THANK YOU.*$', '', shownotes, flags=re.DOTALL)
-
-        # Remove blank lines from the end
-        shownotes = re.sub(r'<p>[ -]*</p>\n$', '', shownotes, flags=re.DOTALL)
-        # Why doesn't this work? e.g. episode 457
-        shownotes = re.sub(r'\n\n$', '\n', shownotes)
-
-        # print('Trimmed shownotes: ', shownotes)
-        return shownotes
+        with getMetrics().span('shownotes.clean'):
+            return self.htmlCleaner.clean(shownotes)
 
     def MakeSummary(self, summary):
         # Don't use 'RECORDED ON' as the summary
@@ -176,55 +233,89 @@ class Fetcher(ABC):
         url = re.sub(r'^(https://i.ytimg.com/)[^/]+/([^/]+)/hqdefault\.jpg$', r'\1/vi_webp/\2/mqdefault.webp', url)
         return url
 
+    # Return a fingerprint of the raw fields of a feed item
+    def Fingerprint(self, *fields):
+        digest = hashlib.blake2b(digest_size=16)
+        for field in fields:
+            digest.update(str(field).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    # Identify the source by the settings that affect how its episodes are derived.
+    # Settings that only affect how much of the feed is read are excluded, so a full import can reuse the fingerprints of only-new imports.
+    def SourceKey(self, source):
+        if self.sourceKey is None:
+            settings = { key: value for key, value in source.items() if key not in ('only-new', 'ignore', 'stream') }
+            settings['shownotes-rules'] = self.config['shownotes-rules'] if 'shownotes-rules' in self.config else None
+            settings['derivation'] = derivationVersion
+            self.sourceKey = self.Fingerprint(json.dumps(settings, sort_keys=True))
+        return self.sourceKey
+
+    # Return True if the item's fingerprint is the same as when the episode was last imported from this source,
+    # in which case the item can be skipped before deriving any episode data from it
+    def ItemUnchanged(self, source, episodeid, fingerprint):
+        if self.episodeStore.unchanged(self.SourceKey(source), episodeid, fingerprint):
+            getMetrics().count('episodes.skipped')
+            return True
+        return False
+
+    # Record the fingerprint of an item once the episode has been updated from it
+    def ItemImported(self, source, episodeid, fingerprint):
+        # A secondary source doesn't create missing episodes, so it must import the item again once the episode exists
+        if self.episodeStore.exists(episodeid):
+            self.episodeStore.setFingerprint(self.SourceKey(source), episodeid, fingerprint)
+
     # episode is a dictionary containing values to be stored in the data file
     # The dictionary must include id
     # If isPrimary is true then new files are created, otherwise they are only updated
     # Returns True if it's a new episode, indicating that the import process should continue
+    # Changes are made to the shared episode store, which writes the data files when the import finishes
     def UpdateEpisodeDatafile(self, episode, isPrimary=True):
-        # Truth table showing how inputs determine outputs
-        #   -------- Inputs --------|------- Outputs ------
-        #   Exists  Changed Master  |   Write   New Episode
-        #   N       x       N       |   N       Y       
-        #   N       x       Y       |   Y       Y
-        #   Y       N       x       |   N       N
-        #   Y       Y       x       |   Y       Y
-
-        # Get the existing episode data
-        episodefolder = os.path.join(self.config['episode-folder'], episode['episodeid'])
-        episodepath = os.path.join(episodefolder, 'episode.json')
-        episodeExists = os.path.isfile(episodepath)
-        if episodeExists:
-            with open(episodepath, 'r', encoding='utf-8') as file:
-                dataDict = json.load(file)
-                file.close()
-            # Merge so episode overwrites dataDict
-            # without rebinding the reference to episode
-            # so fields that were read are avaiable to the caller (e.g. interviewee)
-            episode |= (dataDict | episode)
-            episodeChanged = episode != dataDict
-            if episodeChanged:
-                msg = 'Updating'
-            else:
-                msg = 'No changes to'
-                #msg = None
-        else:
-            if isPrimary:
-                dataDict = {}
-                msg = 'Creating'
-                if not os.path.isdir(episodefolder):
-                    os.makedirs(episodefolder)
+        with getMetrics().span('episodes.update'):
+            # Truth table showing how inputs determine outputs
+            #   -------- Inputs --------|------- Outputs ------
+            #   Exists  Changed Master  |   Write   New Episode
+            #   N       x       N       |   N       Y       
+            #   N       x       Y       |   Y       Y
+            #   Y       N       x       |   N       N
+            #   Y       Y       x       |   Y       Y
+
+            # Get the existing episode data
+            episodepath = self.episodeStore.path(episode['episodeid'])
+            dataDict = self.episodeStore.get(episode['episodeid'])
+            episodeExists = dataDict is not None
+            if episodeExists:
+                # Merge so episode overwrites dataDict
+                # without rebinding the reference to episode
+                # so fields that were read are avaiable to the caller (e.g. interviewee)
+                episode |= (dataDict | episode)
+                episodeChanged = episode != dataDict
+                if episodeChanged:
+                    msg = 'Updating'
+                    outcome = 'updated'
+                else:
+                    msg = 'No changes to'
+                    outcome = 'unchanged'
+                    #msg = None
             else:
-                msg = 'Missing'
-
-        if msg: print(msg + ' '  + episodepath)
-        if (episodeExists and episodeChanged) or (not episodeExists and isPrimary):
-            # Data has changed, so update the data file
-            #DumpEpisode(episode, msg, source)
-            with open(episodepath, 'w', encoding='utf-8') as file:
-                json.dump(episode, file, indent='\t')
-                file.close()
-
-        return not episodeExists or episodeChanged
+                if isPrimary:
+                    msg = 'Creating'
+                    outcome = 'created'
+                else:
+                    msg = 'Missing'
+                    outcome = 'missing'
+                    # The item must be merged once its episode exists, so the feed mustn't be skipped as not modified next time
+                    for url in self.conditionalUrls:
+                        self.httpCache.forget(url)
+            getMetrics().count('episodes.' + outcome)
+
+            if msg: print(msg + ' '  + episodepath)
+            if (episodeExists and episodeChanged) or (not episodeExists and isPrimary):
+                # Data has changed, so update the data file
+                #DumpEpisode(episode, msg, source)
+                self.episodeStore.put(episode)
+
+            return not episodeExists or episodeChanged
 
     # Given a title/description, create a URL friendly file name (i.e. no need to %encode)
     def NormaliseFilename(self, strTitle):
@@ -10,44 +10,59 @@ class FetcherPlugin(Fetcher):
         Fetcher.__init__(self, config) 
 
 
-    def ExtractEpisodes(self, path, source):
+    def ExtractEpisodes(self, stream, source):
         print("Extracting episodes from itunes feed")
 
-        with open(path, mode='r', encoding='utf-8') as file:
-            response = json.load(file)
+        # The standard library has no incremental JSON parser, but the lookup is limited to 200 episodes,
+        # so it is decoded from the response in one go without saving it to a file first
+        response = json.load(stream)
         for item in response['results']:
             if item['wrapperType'] == 'podcastEpisode':
                 title = item['trackName']
                 episodeNo = self.GetEpisodeNo(title)
                 if episodeNo != 0:
-                    episode = {}
-                    if source["primary"]:
-                        episode['title'] = title
-                        episode['filename'] = self.NormaliseFilename(title)
-                        episode['shownotes'] = item['releaseDate']
-                        episode['shownotes'] = self.TrimShownotesHtml(item['description'].strip())
-                        episode['filename'] = self.NormaliseFilename(title)
-                        episode['excerpt'] = self.MakeSummary(episode['shownotes'])
-                        episode['image'] = item['artworkUrl600']
-                        episode['interviewee'] = self.getSpeakers(title)
-
-                    episode['episodeid'] = self.MakeEpisodeId(episodeNo)
-                    #episode['itunesAudioUrl'] = item['episodeUrl']
-                    episode['itunesEpisodeUrl'] = item['trackViewUrl']
-                    #episode['itunesImageUrl'] = item['artworkUrl600']
-
-                    if not self.UpdateEpisodeDatafile(episode, source["primary"]) and source['only-new']:
+                    episodeid = self.MakeEpisodeId(episodeNo)
+                    fingerprint = self.Fingerprint(title, item['description'], item['artworkUrl600'], item['trackViewUrl'])
+                    if self.ItemUnchanged(source, episodeid, fingerprint):
+                        isNew = False
+                    else:
+                        episode = self.ExtractEpisode(item, title, episodeid, source)
+                        isNew = self.UpdateEpisodeDatafile(episode, source["primary"])
+                        self.ItemImported(source, episodeid, fingerprint)
+
+                    if not isNew and source['only-new']:
                         print('Done importing from itunes')
                         break
 
-    def fetch(self, source):
+    def ExtractEpisode(self, item, title, episodeid, source):
+        episode = {}
+        if source["primary"]:
+            episode['title'] = title
+            episode['filename'] = self.NormaliseFilename(title)
+            episode['shownotes'] = item['releaseDate']
+            episode['shownotes'] = self.TrimShownotesHtml(item['description'].strip())
+            episode['filename'] = self.NormaliseFilename(title)
+            episode['excerpt'] = self.MakeSummary(episode['shownotes'])
+            episode['image'] = item['artworkUrl600']
+            episode['interviewee'] = self.getSpeakers(title)
+
+        episode['episodeid'] = episodeid
+        #episode['itunesAudioUrl'] = item['episodeUrl']
+        episode['itunesEpisodeUrl'] = item['trackViewUrl']
+        #episode['itunesImageUrl'] = item['artworkUrl600']
+        return episode
+
+    def download(self, source):
         if not 'id' in source:
             print(f"Source is missing required property 'id': {str(source)}")
-            return False
+            return None
 
         url = f"https://itunes.apple.com/lookup?id={source['id']}&media=podcast&entity=podcastEpisode&limit=200"
-        path = self.HttpDownloadRss(url, 'itunes.json')
-        if path:
-            self.ExtractEpisodes(path, source)
+        return self.OpenFeed(url, 'itunes.json', source)
 
-        return True
+    def fetch(self, source, stream):
+        if stream:
+            try:
+                self.ExtractEpisodes(stream, source)
+            finally:
+                self.CloseFeed(stream)
@@ -1,10 +1,10 @@
 import os
 import re
-import xml.etree.ElementTree as et # See https://docs.python.org/3/library/xml.etree.elementtree.html
-import boto3
+from contextlib import closing
 
 from fetcher import Fetcher
 import fetcherutil
+from metrics import getMetrics
 
 class FetcherPlugin(Fetcher):
     def __init__(self, config):
@@ -24,7 +24,7 @@ class FetcherPlugin(Fetcher):
             # Maybe episode data file was deleted to force its recreation, so if the transcript remains, it's not intended to be regenerated
             print(f"Not uploading audio file already transcribed locally: Episode '{episodeID}' in '{path}")
         else:
-            client = boto3.client('s3')
+            client = fetcherutil.GetS3Client(self.config)
             if fetcherutil.S3EpisodeExists(episodeID, self.config['bucket'], self.config['transcript-prefix'], client):
                 # There is already a remote transcript file for this episode
                 print(f"Not uploading audio file already transcribed: Episode '{episodeID}' in bucket '{self.config['bucket']}/{self.config['transcript-prefix']}'")
@@ -42,47 +42,42 @@ class FetcherPlugin(Fetcher):
                         + filename
                     print(f"Uploading audio file for transcription: '{filename}' to bucket '{self.config['bucket']}/{self.config['audio-prefix']}'")
                     path = self.HttpDownloadRss(audioUrl, filename)
-                    client.upload_file(path, self.config['bucket'], self.config['audio-prefix'] + '/' + filename)
+                    with getMetrics().span('s3.upload'):
+                        client.upload_file(path, self.config['bucket'], self.config['audio-prefix'] + '/' + filename)
+                    getMetrics().count('s3.uploads')
+                    fetcherutil.GetS3Index(client, self.config['bucket'], self.config['audio-prefix']).add(self.config['audio-prefix'] + '/' + filename)
 
-    def ExtractSpotify(self, root, source):
+    # items is an iterable of the feed's <item> elements
+    def ExtractSpotify(self, items, source):
         print("Extracting episodes from Spotify feed")
         transcribeCount = 0
         maxTranscribeCount = self.config["transcribe-max"]
 
-        channel = root.find('channel')
         itunesNamespace = {'itunes': 'http://www.itunes.com/dtds/podcast-1.0.dtd'}
         if source['only-new']:
             print("Importing new episodes from RSS")
         else:
             print("Importing all episodes from RSS")
-        for item in channel.iter('item'):
+        for item in items:
             title = item.find('title').text.strip()
             episodeNo = self.GetEpisodeNo(title)
             if episodeNo != 0:
-                episode = {}
-
-                if source["primary"]:
-                    episode['title'] = title
-                    episode['filename'] = self.NormaliseFilename(title)
-                    publishedDate = item.find('pubDate').text
-                    # episode['spotifypublished'] = publishedDate
-                    publishedDate = self.NormaliseDateFormat(publishedDate)
-                    episode['published'] = publishedDate
-                    episode['shownotes'] = self.TrimShownotesHtml(item.find('description').text.strip())
-                    episode['filename'] = self.NormaliseFilename(title)
-                    episode['excerpt'] = self.MakeSummary(episode['shownotes'])
-                    episode['image'] = item.find('itunes:image', itunesNamespace).attrib['href']
-                    episode['interviewee'] = self.getSpeakers(title)
-
                 #episode['episodeid'] = MakeEpisodeId(title, publishedDate)
-                episode['episodeid'] = self.MakeEpisodeId(episodeNo)
-
-                episode['spotifyAudioUrl'] = item.find('enclosure').attrib['url']
-                episode['spotifyEpisodeUrl'] = item.find('link').text
-                episode['spotifyImageUrl'] = item.find('itunes:image', itunesNamespace).attrib['href']
-
-                # # print("guid ", item.find('guid').text)
-                # # print("duration: ", item.find('itunes:duration', itunesNamespace).text)
+                episodeid = self.MakeEpisodeId(episodeNo)
+                fingerprint = self.Fingerprint(
+                    title,
+                    item.findtext('pubDate'),
+                    item.findtext('description'),
+                    item.find('itunes:image', itunesNamespace).attrib['href'],
+                    item.find('enclosure').attrib['url'],
+                    item.findtext('link')
+                )
+                if self.ItemUnchanged(source, episodeid, fingerprint):
+                    isNew = False
+                else:
+                    episode = self.ExtractEpisode(item, title, episodeid, source)
+                    isNew = self.UpdateEpisodeDatafile(episode, source["primary"])
+                    self.ItemImported(source, episodeid, fingerprint)
 
                 # If new then submit for transcription, if not new and we only want new then break
                 # ---Condition----     ----Result----
@@ -91,7 +86,7 @@ class FetcherPlugin(Fetcher):
                 # 0        1           0            1
                 # 1        0           0            0
                 # 1        1           1            0
-                if self.UpdateEpisodeDatafile(episode, source["primary"]):
+                if isNew:
                     # Is transcription configured?
                     if source['only-new'] and 'bucket' in self.config:
                         transcribeCount += 1
@@ -103,15 +98,45 @@ class FetcherPlugin(Fetcher):
                     print('Done importing from RSS')
                     break
 
-    def fetch(self, source):
+    def ExtractEpisode(self, item, title, episodeid, source):
+        itunesNamespace = {'itunes': 'http://www.itunes.com/dtds/podcast-1.0.dtd'}
+        episode = {}
+
+        if source["primary"]:
+            episode['title'] = title
+            episode['filename'] = self.NormaliseFilename(title)
+            publishedDate = item.find('pubDate').text
+            # episode['spotifypublished'] = publishedDate
+            publishedDate = self.NormaliseDateFormat(publishedDate)
+            episode['published'] = publishedDate
+            episode['shownotes'] = self.TrimShownotesHtml(item.find('description').text.strip())
+            episode['filename'] = self.NormaliseFilename(title)
+            episode['excerpt'] = self.MakeSummary(episode['shownotes'])
+            episode['image'] = item.find('itunes:image', itunesNamespace).attrib['href']
+            episode['interviewee'] = self.getSpeakers(title)
+
+        episode['episodeid'] = episodeid
+
+        episode['spotifyAudioUrl'] = item.find('enclosure').attrib['url']
+        episode['spotifyEpisodeUrl'] = item.find('link').text
+        episode['spotifyImageUrl'] = item.find('itunes:image', itunesNamespace).attrib['href']
+
+        # # print("guid ", item.find('guid').text)
+        # # print("duration: ", item.find('itunes:duration', itunesNamespace).text)
+        return episode
+
+    def download(self, source):
         if not 'url' in source:
             print(f"Source is missing required property 'url': {str(source)}")
-            return False
+            return None
 
-        rsspath = self.HttpDownloadRss(source['url'], 'spotify.xml')
-        if rsspath:
-            tree = et.parse(rsspath)
-            root = tree.getroot()
-            self.ExtractSpotify(root, source)
+        return self.OpenFeed(source['url'], 'spotify.xml', source)
 
-        return True
+    def fetch(self, source, stream):
+        if stream:
+            # Parse the items incrementally, so that in only-new mode the feed is only parsed as far as the first existing episode
+            try:
+                with closing(self.IterElements(stream, 'item')) as items:
+                    self.ExtractSpotify(items, source)
+            finally:
+                self.CloseFeed(stream)
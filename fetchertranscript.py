@@ -1,9 +1,10 @@
 import os
 from datetime import datetime, timezone
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 
 import fetcherutil
 from fetcher import Fetcher
+from metrics import getMetrics
 
 # -------- S3 --------  -- Local -  Newer   Action
 # audio     transcript  transcript
@@ -18,11 +19,17 @@ class FetcherPlugin(Fetcher):
     def __init__(self, config):
         Fetcher.__init__(self, config) 
 
-    def fetch(self, source):
-        client = boto3.client('s3')
-        response = client.list_objects_v2(Bucket=self.config['bucket'], Prefix=self.config['transcript-prefix'])
-        if response["KeyCount"] > 0:
-            for o in response['Contents']:
+    # Transcripts don't update the episode data, so they are synchronised entirely while other sources download
+    def download(self, source):
+        client = fetcherutil.GetS3Client(self.config)
+        transcripts = fetcherutil.GetS3Index(client, self.config['bucket'], self.config['transcript-prefix'])
+        audios = fetcherutil.GetS3Index(client, self.config['bucket'], self.config['audio-prefix'])
+        # List of (key, local path) of transcripts to download
+        downloads = []
+        # Keys of transcripts and audio files to delete
+        deletes = []
+        if len(transcripts.objects) > 0:
+            for o in transcripts.objects.values():
                 filename = o["Key"]
                 episodeID = fetcherutil.getEpisodeID(filename)
                 action = 0
@@ -46,15 +53,59 @@ class FetcherPlugin(Fetcher):
                     if action > 0:
                         # Download the transcript
                         print('Getting transcript for episode ' + episodeID + ' from ' + filename + ' to ' + filepath)
-                        client.download_file(self.config['bucket'], filename, filepath)
+                        downloads.append((filename, filepath))
                     elif action < 0:
                         # Delete the remote transcript
                         print('Deleting previously imported transcript for episode ' + episodeID + ' ' + filename)
-                        client.delete_object(Bucket=self.config['bucket'], Key=filename)
+                        deletes.append(filename)
                         # Delete the remote audio, if it exists
-                        filename = fetcherutil.S3EpisodeExists(episodeID, self.config['bucket'], self.config['audio-prefix'], client)
+                        filename = audios.find(episodeID)
                         if filename:
-                            client.delete_object(Bucket=self.config['bucket'], Key=filename)
+                            deletes.append(filename)
                     # else zero action i.e. Do nothing
                 # else - not a transcript file, so ignore it
         # else - There are no transcripts on S3
+
+        jobs = self.config['transcript-jobs'] if 'transcript-jobs' in self.config else 8
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            # list() waits for them all, and raises the first exception, if any
+            list(executor.map(lambda download: self.DownloadTranscript(client, *download), downloads))
+
+        for key in self.DeleteObjects(client, deletes):
+            transcripts.remove(key)
+            audios.remove(key)
+
+    # Download to a temporary file which is then renamed,
+    # so an interrupted download never leaves a truncated transcript to be turned into a page
+    def DownloadTranscript(self, client, key, filepath):
+        temppath = filepath + '.tmp'
+        metrics = getMetrics()
+        with metrics.span('s3.download'):
+            client.download_file(self.config['bucket'], key, temppath)
+        os.replace(temppath, filepath)
+        metrics.count('s3.downloads')
+        metrics.count('s3.bytes', os.path.getsize(filepath))
+
+    # Delete objects in batches of up to 1000, which is the most that delete_objects accepts
+    # Returns the keys that were deleted
+    def DeleteObjects(self, client, keys):
+        batchSize = 1000
+        failed = set()
+        metrics = getMetrics()
+        for start in range(0, len(keys), batchSize):
+            with metrics.span('s3.delete'):
+                response = client.delete_objects(
+                    Bucket=self.config['bucket'],
+                    Delete={
+                        'Objects': [{ 'Key': key } for key in keys[start:start + batchSize]],
+                        'Quiet': True
+                    }
+                )
+            for error in response.get('Errors', []):
+                print(f"Error deleting {error['Key']}: {error['Code']} {error['Message']}")
+                failed.add(error['Key'])
+        metrics.count('s3.deletes', len(keys) - len(failed))
+        return [key for key in keys if key not in failed]
+
+    def fetch(self, source, payload):
+        pass
@@ -1,5 +1,10 @@
 import os
 import re
+import threading
+import boto3
+
+from cassette import getCassette, CassetteS3
+from metrics import getMetrics
 
 # Get the local path of the transcript for episodeID
 # Optionally create the folder if it doesn't already exist
@@ -17,16 +22,70 @@ def getEpisodeID(filename):
     # Remove everything from the first dot
     return re.sub("\..*$", "", filename)
 
+# The S3 client is created once and shared by all fetchers, as clients are thread-safe but boto3's default session, which creates them, isn't
+s3Client = None
+s3ClientLock = threading.Lock()
+
+# Get the S3 client, whose calls are recorded to or replayed from the cassette in test mode
+# Replaying doesn't need AWS credentials, so there is no real client then
+def GetS3Client(config):
+    global s3Client
+    with s3ClientLock:
+        if s3Client is None:
+            cassette = getCassette(config)
+            if cassette is None:
+                s3Client = boto3.client('s3')
+            else:
+                s3Client = CassetteS3(cassette, boto3.client('s3') if cassette.recording() else None)
+        return s3Client
+
+# The objects under a prefix of an S3 bucket, indexed by episode ID
+class S3Index():
+    def __init__(self, client, bucket, prefix):
+        # Dictionary of key: object, as returned by list_objects_v2
+        self.objects = {}
+        # Dictionary of episodeID: [ keys of the objects for that episode ]
+        self.episodes = {}
+
+        # See https://www.peterbe.com/plog/fastest-way-to-find-out-if-a-file-exists-in-s3
+        # https://docs.aws.amazon.com/AmazonS3/latest/API/API_ListObjectsV2.html
+        # There doesn't appear to be a way to filter (e.g. using wildcards), so list them all, 1000 per page
+        metrics = getMetrics()
+        with metrics.span('s3.list'):
+            paginator = client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                metrics.count('s3.list-pages')
+                for o in page.get('Contents', []):
+                    self.objects[o['Key']] = o
+                    self.episodes.setdefault(getEpisodeID(o['Key']), []).append(o['Key'])
+
+    # Get the key of the first object for episodeID, or None if there isn't one
+    def find(self, episodeID):
+        keys = self.episodes.get(episodeID)
+        return keys[0] if keys else None
+
+    # Record an object that has been uploaded
+    def add(self, key):
+        self.objects[key] = { 'Key': key }
+        self.episodes.setdefault(getEpisodeID(key), []).append(key)
+
+    # Record an object that has been deleted
+    def remove(self, key):
+        if key in self.objects:
+            del self.objects[key]
+            self.episodes[getEpisodeID(key)].remove(key)
+
+# Each prefix is listed once per run, and the index is shared by all fetchers
+s3Indexes = {}
+s3IndexesLock = threading.Lock()
+
+def GetS3Index(client, bucket, prefix):
+    with s3IndexesLock:
+        if (bucket, prefix) not in s3Indexes:
+            s3Indexes[(bucket, prefix)] = S3Index(client, bucket, prefix)
+        return s3Indexes[(bucket, prefix)]
+
 # Get the key of the file matching episodeID in the given bucket, or None if there isn't one
 # The filename extension is ignored
 def S3EpisodeExists(episodeID, bucket, prefix, client):
-    # See https://www.peterbe.com/plog/fastest-way-to-find-out-if-a-file-exists-in-s3
-    # https://docs.aws.amazon.com/AmazonS3/latest/API/API_ListObjectsV2.html
-    # There doesn't appear to be a way to filter (e.g. using wildcards)
-    response = client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    if response["KeyCount"] > 0:
-        for o in response['Contents']:
-            if getEpisodeID(o["Key"]) == episodeID:
-                #remoteModified = o["LastModified"]
-                return o["Key"]
-    return None
+    return GetS3Index(client, bucket, prefix).find(episodeID)
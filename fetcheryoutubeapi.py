@@ -1,19 +1,33 @@
 import os
 import sys
+import json
 from youtubeplaylists import YouTubePlaylists
 from youtubeapi import YouTubeAPI
 
 
 from fetcher import Fetcher
 
+# The request for the first page of the episodes in a playlist, usually the channel's uploads
+# Equivalent to: https://www.googleapis.com/youtube/v3/playlistItems?part=snippet&playlistId=UUTUcatGD6xu4tAcxG-1D4Bg&key=<SPI_KEY>
+# https://googleapis.github.io/google-api-python-client/docs/dyn/youtube_v3.playlistItems.html#list
+def UploadsRequest(youtubeAPI, playlistId):
+    return youtubeAPI.youtube.playlistItems().list(
+        playlistId = playlistId,
+        part = 'snippet',
+        maxResults = 50,
+        fields = 'nextPageToken,items(id,snippet(title,publishedAt,description,resourceId(videoId),thumbnails(maxres(url))))'
+    )
+
 class FetcherPlugin(Fetcher):
     def __init__(self, config):
         Fetcher.__init__(self, config) 
 
-    def fetch(self, source):
+    # Loading the playlists is independent of the episode data, so it is done while other sources download
+    def download(self, source):
         print(f"Download episodes for channel {source['channel']} via Youtube API")
 
-        if not 'GOOGLE_API_KEY' in os.environ:
+        # Replaying recorded responses doesn't need a key
+        if not 'GOOGLE_API_KEY' in os.environ and not ('test' in self.config and self.config['test'] == 'load'):
             print("ERROR: Define environment variable: GOOGLE_API_KEY")
             sys.exit(1)
 
@@ -21,15 +35,12 @@ class FetcherPlugin(Fetcher):
 
         playlists = YouTubePlaylists(youtubeAPI, source['channel'], source['only-new'])
         playlists.load()
+        return playlists
+
+    def fetch(self, source, playlists):
+        youtubeAPI = playlists.youtubeAPI
 
-        # Equivalent to: https://www.googleapis.com/youtube/v3/playlistItems?part=snippet&playlistId=UUTUcatGD6xu4tAcxG-1D4Bg&key=<SPI_KEY>
-        # https://googleapis.github.io/google-api-python-client/docs/dyn/youtube_v3.playlistItems.html#list
-        request = youtubeAPI.youtube.playlistItems().list(
-            playlistId = source['playlist'],
-            part = 'snippet',
-            maxResults = 50,
-            fields = 'nextPageToken,items(id,snippet(title,publishedAt,description,resourceId(videoId),thumbnails(maxres(url))))'
-        )
+        request = UploadsRequest(youtubeAPI, source['playlist'])
 
         print("Extracting episodes via YouTube API")
         #print( 'Videos in list %s' % uploads_playlist_id)
@@ -38,36 +49,29 @@ class FetcherPlugin(Fetcher):
             print("Importing all episodes")
         while (not source['only-new'] or newepisode) and request:
             # Fetch the next page
-            response = youtubeAPI.execute(request, ['playlistId', 'pageToken'])
+            response = youtubeAPI.execute(request)
+            # Find the playlists of the page's new videos together, rather than one at a time
+            playlists.resolve(self.NewVideoIds(response['items']))
             for playlist_item in response['items']:
                 title = playlist_item['snippet']['title'].strip()
                 episodeNo = self.GetEpisodeNo(title)
                 if episodeNo != 0:
-                    episode = {}
-                    episode['episodeid'] = self.MakeEpisodeId(episodeNo)
-                    episode['title'] = title
-
-                    publishedDate = playlist_item['snippet']['publishedAt']
-                    publishedDate = publishedDate[0:10]
-                    episode['published'] = publishedDate
-
-                    episode['shownotes'] = self.TrimShownotes(playlist_item['snippet']['description'])
-
-                    episode['filename'] = self.NormaliseFilename(title)
-                    episode['excerpt'] = self.MakeSummary(episode['shownotes'])
-
-                    episode['youtubeid'] = playlist_item['snippet']['resourceId']['videoId']
-                    episode['image'] = self.NormaliseImageUrl(playlist_item['snippet']['thumbnails']['maxres']['url'])
-
-                    episode['interviewee'] = self.getSpeakers(title)
-
-                    tags = playlists.names(episode['youtubeid'])
-                    if tags:
-                        episode['tags'] = tags
+                    episodeid = self.MakeEpisodeId(episodeNo)
+                    # Playlist membership isn't part of the item, so it's included in the fingerprint
+                    tags = playlists.names(playlist_item['snippet']['resourceId']['videoId'])
+                    fingerprint = self.Fingerprint(json.dumps(playlist_item['snippet'], sort_keys=True), *tags)
+                    if self.ItemUnchanged(source, episodeid, fingerprint):
+                        newepisode = False
                     else:
-                        print(f"Episode {episodeNo} is in no playlists")
+                        episode = self.ExtractEpisode(playlist_item, title, episodeid)
+                        if tags:
+                            episode['tags'] = tags
+                        else:
+                            print(f"Episode {episodeNo} is in no playlists")
+
+                        newepisode = self.UpdateEpisodeDatafile(episode, source["primary"])
+                        self.ItemImported(source, episodeid, fingerprint)
 
-                    newepisode = self.UpdateEpisodeDatafile(episode, source["primary"])
                     if source['only-new'] and not newepisode:
                         print('Done importing from YouTube API')
                         break
@@ -77,3 +81,37 @@ class FetcherPlugin(Fetcher):
                 request = youtubeAPI.youtube.playlistItems().list_next(request, response)
 
         playlists.save()
+        youtubeAPI.printQuota()
+
+    # Get the videos of the episodes on a page that don't exist yet, and of the first that does, which the import needs the playlists of.
+    # In only-new mode, the import usually stops at the first existing episode. If it doesn't, because that episode has changed,
+    # names finds the playlists of the videos after it one at a time.
+    def NewVideoIds(self, playlist_items):
+        videoIds = []
+        for playlist_item in playlist_items:
+            episodeNo = self.GetEpisodeNo(playlist_item['snippet']['title'].strip())
+            if episodeNo != 0:
+                videoIds.append(playlist_item['snippet']['resourceId']['videoId'])
+                if self.episodeStore.exists(self.MakeEpisodeId(episodeNo)):
+                    break
+        return videoIds
+
+    def ExtractEpisode(self, playlist_item, title, episodeid):
+        episode = {}
+        episode['episodeid'] = episodeid
+        episode['title'] = title
+
+        publishedDate = playlist_item['snippet']['publishedAt']
+        publishedDate = publishedDate[0:10]
+        episode['published'] = publishedDate
+
+        episode['shownotes'] = self.TrimShownotes(playlist_item['snippet']['description'])
+
+        episode['filename'] = self.NormaliseFilename(title)
+        episode['excerpt'] = self.MakeSummary(episode['shownotes'])
+
+        episode['youtubeid'] = playlist_item['snippet']['resourceId']['videoId']
+        episode['image'] = self.NormaliseImageUrl(playlist_item['snippet']['thumbnails']['maxres']['url'])
+
+        episode['interviewee'] = self.getSpeakers(title)
+        return episode
@@ -1,72 +1,99 @@
-import xml.etree.ElementTree as et # See https://docs.python.org/3/library/xml.etree.elementtree.html
+from contextlib import closing
 
 from fetcher import Fetcher
 
+mediaNamespace = '{http://search.yahoo.com/mrss/}'
+youtubeNamespace = '{http://www.youtube.com/xml/schemas/2015}'
+defaultNamespace = '{http://www.w3.org/2005/Atom}'
+
 class FetcherPlugin(Fetcher):
     def __init__(self, config):
         Fetcher.__init__(self, config) 
 
-    def fetch(self, source):
+    def download(self, source):
         print("Download from Youtube RSS " + source['url'])
-        rsspath = self.HttpDownloadRss(source['url'], 'youtuberss.xml')
-        if rsspath:
-            tree = et.parse(rsspath)
-            root = tree.getroot()
-            mediaNamespace = '{http://search.yahoo.com/mrss/}'
-            youtubeNamespace = '{http://www.youtube.com/xml/schemas/2015}'
-            defaultNamespace = '{http://www.w3.org/2005/Atom}'
-
-            if source['only-new']:
-                print("Importing new episodes from YouTube RSS")
-            else:
-                print("Importing all episodes from YouTube RSS")
-            for item in root.iter(defaultNamespace + 'entry'):
+        return self.OpenFeed(source['url'], 'youtuberss.xml', source)
+
+    def ExtractEntries(self, stream, source):
+        if source['only-new']:
+            print("Importing new episodes from YouTube RSS")
+        else:
+            print("Importing all episodes from YouTube RSS")
+        # Parse the entries incrementally, so that in only-new mode the feed is only parsed as far as the first existing episode
+        with closing(self.IterElements(stream, defaultNamespace + 'entry')) as items:
+            for item in items:
 
                 title = item.find(defaultNamespace + 'title').text.strip()
                 episodeNo = self.GetEpisodeNo(title)
                 if episodeNo != 0:
-                    episode = {}
-                    episode['episodeid'] = self.MakeEpisodeId(episodeNo)
-                    episode['title'] = title
+                    episodeid = self.MakeEpisodeId(episodeNo)
+                    mediaGroup = item.find(mediaNamespace + 'group')
+                    fingerprint = self.Fingerprint(
+                        title,
+                        item.findtext(defaultNamespace + 'published'),
+                        mediaGroup.findtext(mediaNamespace + 'description'),
+                        item.findtext(youtubeNamespace + 'videoId'),
+                        mediaGroup.find(mediaNamespace + 'thumbnail').attrib['url']
+                    )
+                    if self.ItemUnchanged(source, episodeid, fingerprint):
+                        isNew = False
+                    else:
+                        episode = self.ExtractEpisode(item, title, episodeid)
+                        isNew = self.UpdateEpisodeDatafile(episode, source["primary"])
+                        self.ItemImported(source, episodeid, fingerprint)
 
-                    # 2012-09-10T15:39:02+00:00
-                    publishedDate = item.find(defaultNamespace + 'published').text
-                    #episode['youtubepublished'] = publishedDate
-                    publishedDate = publishedDate[0:10]
-                    episode['published'] = publishedDate
+                    if not isNew and source['only-new']:
+                        print('Done importing from YouTube feed')
+                        break
 
-                    mediaGroup = item.find(mediaNamespace + 'group')
-                    episode['shownotes'] = self.TrimShownotes(mediaGroup.find(mediaNamespace + 'description').text)
+    def ExtractEpisode(self, item, title, episodeid):
+        episode = {}
+        episode['episodeid'] = episodeid
+        episode['title'] = title
 
-                    episode['filename'] = self.NormaliseFilename(title)
-                    episode['excerpt'] = self.MakeSummary(episode['shownotes'])
+        # 2012-09-10T15:39:02+00:00
+        publishedDate = item.find(defaultNamespace + 'published').text
+        #episode['youtubepublished'] = publishedDate
+        publishedDate = publishedDate[0:10]
+        episode['published'] = publishedDate
 
-                    episode['youtubeid'] = item.find(youtubeNamespace + 'videoId').text
-                    episode['image'] = self.NormaliseImageUrl(mediaGroup.find(mediaNamespace + 'thumbnail').attrib['url'])
+        mediaGroup = item.find(mediaNamespace + 'group')
+        episode['shownotes'] = self.TrimShownotes(mediaGroup.find(mediaNamespace + 'description').text)
 
-                    episode['interviewee'] = self.getSpeakers(title)
-                    #intervieweeFirst = []
-                    #for interviewee in intervieweeFull:
-                    #    intervieweeFirst.append(interviewee.split()[0])
-                    #episode['interviewee-first'] = intervieweeFirst
+        episode['filename'] = self.NormaliseFilename(title)
+        episode['excerpt'] = self.MakeSummary(episode['shownotes'])
 
-                    if not self.UpdateEpisodeDatafile(episode, source["primary"]) and source['only-new']:
-                        print('Done importing from YouTube feed')
-                        break
-            # print('id=(', item.find('episodeid').text, ')')
-            # print('link=(', item.find('link').attrib['href'], ')')
-            # print('updated=(', item.find('updated').text, ')')
-            # mediaGroup = item.find(mediaNamespace + 'group')
-
-            # mediaElement = mediaGroup.find(mediaNamespace + 'content')
-            # print('media:content[url]=(', mediaElement.attrib['url'], ')')
-            # print('media:content[width]=(', mediaElement.attrib['width'], ')')
-            # print('media:content[height]=(', mediaElement.attrib['height'], ')')
-
-            # mediaElement = mediaGroup.find(mediaNamespace + 'thumbnail')
-            # print('media:thumbnail[url]=(', mediaElement.attrib['url'], ')')
-            # print('media:thumbnail[width]=(', mediaElement.attrib['width'], ')')
-            # print('media:thumbnail[height]=(', mediaElement.attrib['height'], ')')
+        episode['youtubeid'] = item.find(youtubeNamespace + 'videoId').text
+        episode['image'] = self.NormaliseImageUrl(mediaGroup.find(mediaNamespace + 'thumbnail').attrib['url'])
+
+        episode['interviewee'] = self.getSpeakers(title)
+        #intervieweeFirst = []
+        #for interviewee in intervieweeFull:
+        #    intervieweeFirst.append(interviewee.split()[0])
+        #episode['interviewee-first'] = intervieweeFirst
+        return episode
+
+        # print('id=(', item.find('episodeid').text, ')')
+        # print('link=(', item.find('link').attrib['href'], ')')
+        # print('updated=(', item.find('updated').text, ')')
+        # mediaGroup = item.find(mediaNamespace + 'group')
+
+        # mediaElement = mediaGroup.find(mediaNamespace + 'content')
+        # print('media:content[url]=(', mediaElement.attrib['url'], ')')
+        # print('media:content[width]=(', mediaElement.attrib['width'], ')')
+        # print('media:content[height]=(', mediaElement.attrib['height'], ')')
+
+        # mediaElement = mediaGroup.find(mediaNamespace + 'thumbnail')
+        # print('media:thumbnail[url]=(', mediaElement.attrib['url'], ')')
+        # print('media:thumbnail[width]=(', mediaElement.attrib['width'], ')')
+        # print('media:thumbnail[height]=(', mediaElement.attrib['height'], ')')
+
+    def fetch(self, source, stream):
+        if stream:
+            try:
+                self.ExtractEntries(stream, source)
+            finally:
+                self.CloseFeed(stream)
 
     # Extract the video ID from a link in the format
     # https://www.youtube.com/watch?v=610dKJEbbL0
@@ -0,0 +1,69 @@
+import os
+import json
+
+# Remembers the ETag and Last-Modified validators of downloaded urls,
+# so later runs can make conditional requests and skip feeds that haven't changed
+class HttpCache():
+    def __init__(self, path):
+        self.path = path
+        # Dictionary of url: { etag, last-modified }
+        self.validators = {}
+        self.changed = False
+        self.load()
+
+    # Get the conditional request headers for url, if it has been downloaded before
+    def headers(self, url):
+        headers = {}
+        validator = self.validators.get(url, {})
+        if 'etag' in validator:
+            headers['If-None-Match'] = validator['etag']
+        if 'last-modified' in validator:
+            headers['If-Modified-Since'] = validator['last-modified']
+        return headers
+
+    # Store the validators from the headers of a successful response
+    def update(self, url, headers):
+        validator = {}
+        if headers.get('ETag'):
+            validator['etag'] = headers['ETag']
+        if headers.get('Last-Modified'):
+            validator['last-modified'] = headers['Last-Modified']
+
+        if validator != self.validators.get(url, {}):
+            if validator:
+                self.validators[url] = validator
+            else:
+                del self.validators[url]
+            self.changed = True
+
+    # Remove the validators of url, so it is downloaded in full next time
+    def forget(self, url):
+        if url in self.validators:
+            del self.validators[url]
+            self.changed = True
+
+    def load(self):
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, mode='r', encoding='utf-8') as file:
+                    self.validators = json.load(file)
+            except Exception as error:
+                print(f"Error reading the http cache file ({type(error).__name__}): {error}")
+
+    def save(self):
+        if self.changed:
+            try:
+                with open(self.path, mode='w', encoding='utf-8') as file:
+                    json.dump(self.validators, file, indent='\t')
+                self.changed = False
+            except Exception as error:
+                print(f"Error writing the http cache file ({type(error).__name__}): {error}")
+
+# The cache is shared by all fetchers in the process
+httpCache = None
+
+def getHttpCache(config):
+    global httpCache
+    if httpCache is None:
+        httpCache = HttpCache(config['http-cache'] if 'http-cache' in config else 'http-cache.json')
+    return httpCache
@@ -1,11 +1,15 @@
 import argparse
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from fetcherrss import FetcherPlugin as FetcherRss
 from fetcheryoutuberss import FetcherPlugin as FetcherYoutubeRss
 from fetcheryoutubeapi import FetcherPlugin as FetcherYoutubeAPI
 from fetchertranscript import FetcherPlugin as FetcherTranscript
 from fetcheritunes import FetcherPlugin as FetcherItunes
+from httpcache import getHttpCache
+from episodestore import getEpisodeStore
+from metrics import getMetrics
 
 # Merge 2 dictionaries recursively, so items in sub-dictionaries are merged
 # If the same item exists in both, enhancer overwrites tgt
@@ -26,7 +30,7 @@ def merge_dicts(tgt, enhancer):
 # If implementations need to use custom fetchers then some kind of plugin system is needed
 #cls = __import__("rssfetcher")
 # fetcher = Fetcher.factory(source["type"], config)
-def fetchSource(name, source, config):
+def createFetcher(name, source, config):
     fetcher = None
     if not 'type' in source:
         print(f"Data source configuration '{name}' is missing the 'type': {str(source)}")
@@ -45,10 +49,49 @@ def fetchSource(name, source, config):
         fetcher = FetcherTranscript(config)
     else:
         print(f"Invalid data source type for source '{name}': {source['type']}")
+    return fetcher
 
-    if fetcher:
-        print(f"Fetching from data source '{name}' ({source['type']})")
-        fetcher.fetch(source)
+# Download a source's payload, timed as source.<name>.download
+def downloadSource(fetcher, name, source):
+    with getMetrics().span(f"source.{name}.download"):
+        return fetcher.download(source)
+
+# Download all sources concurrently, then fetch their episodes one source at a time.
+# Primary sources are fetched first, because secondary sources only update episodes that already exist.
+def fetchSources(config, jobs):
+    fetchers = {}
+    for name, source in config["source"].items():
+        fetcher = createFetcher(name, source, config)
+        if fetcher:
+            fetchers[name] = fetcher
+
+    # sorted is stable, so sources keep their configured order within the primary and secondary groups
+    names = sorted(fetchers, key=lambda name: not config["source"][name]["primary"])
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        downloads = {}
+        for name in names:
+            print(f"Downloading from data source '{name}' ({config['source'][name]['type']})")
+            downloads[name] = executor.submit(downloadSource, fetchers[name], name, config["source"][name])
+
+        for name in names:
+            source = config["source"][name]
+            payload = downloads[name].result()
+            print(f"Fetching from data source '{name}' ({source['type']})")
+            with getMetrics().span(f"source.{name}.fetch"):
+                fetchers[name].fetch(source, payload)
+
+    return names
+
+# Print how long each source took, from its spans
+def printTimings(names):
+    if len(names) == 0:
+        return
+    metrics = getMetrics()
+    width = max(len(name) for name in names)
+    print('Source timings (seconds):')
+    for name in names:
+        print(f"  {name:<{width}}  download {metrics.seconds(f'source.{name}.download'):7.2f}  fetch {metrics.seconds(f'source.{name}.fetch'):7.2f}")
 
 def importer():
     parser = argparse.ArgumentParser()
@@ -56,6 +99,9 @@ def importer():
     parser.add_argument('-f', '--configfile')
     parser.add_argument('-o', '--override', action='store_true')
     parser.add_argument('-i', '--ignore')
+    parser.add_argument('-j', '--jobs', type=int, default=4)
+    # Write the timings and counters of the run to this JSON file
+    parser.add_argument('--metrics-out')
     args = parser.parse_args()
 
     config = {}
@@ -105,8 +151,24 @@ def importer():
             config["source"][name]["only-new"] = True
 
     # Process data sources defined in the config file
-    for name, source in config["source"].items():
-        fetchSource(name, source, config)
+    metrics = getMetrics()
+    try:
+        names = fetchSources(config, args.jobs)
+    finally:
+        # Write the episodes that changed, including those fetched before any failure
+        with metrics.span('episodes.write'):
+            count = getEpisodeStore(config).flush()
+        metrics.count('episodes.written', count)
+        print(f"{count} episode data files written")
+        # The metrics of a failed import show how far it got
+        if args.metrics_out:
+            metrics.save(args.metrics_out, 'import')
+
+    # Save the validators of the downloaded feeds only after they have all been processed,
+    # so a failed import doesn't cause unprocessed feeds to be skipped as not modified next time
+    getHttpCache(config).save()
+
+    printTimings(names)
 
 if __name__ == '__main__':
     importer()
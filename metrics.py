@@ -0,0 +1,82 @@
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from episodestore import writeJson
+
+# Timings and counters of the stages of a run, reported as JSON with --metrics-out
+# A span times a block of code. Each span name accumulates the number of times it ran, the total seconds and the longest.
+# Spans run concurrently, e.g. downloads, so their totals can add up to more than the wall time.
+# A counter adds up a number, e.g. bytes downloaded or episodes created.
+# Names are dotted, starting with the stage, e.g. http.download, episodes.created
+class Metrics():
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self.start = time.perf_counter()
+        # Dictionary of name: { count, seconds, max }
+        self.spans = {}
+        # Dictionary of name: number
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addSpan(name, 1, time.perf_counter() - start)
+
+    def addSpan(self, name, count, seconds, longest=None):
+        with self.lock:
+            span = self.spans.setdefault(name, { 'count': 0, 'seconds': 0, 'max': 0 })
+            span['count'] += count
+            span['seconds'] += seconds
+            span['max'] = max(span['max'], seconds if longest is None else longest)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Get the total seconds of a span, or 0 if it hasn't run
+    def seconds(self, name):
+        with self.lock:
+            return self.spans[name]['seconds'] if name in self.spans else 0
+
+    # Get the spans and counters recorded since the last take, e.g. by a job in a worker process, for the parent to merge
+    def take(self):
+        with self.lock:
+            taken = { 'spans': self.spans, 'counters': self.counters }
+            self.spans = {}
+            self.counters = {}
+        return taken
+
+    # Add the spans and counters from take
+    def merge(self, taken):
+        for name, span in taken['spans'].items():
+            self.addSpan(name, span['count'], span['seconds'], span['max'])
+        for name, value in taken['counters'].items():
+            self.count(name, value)
+
+    def report(self, command):
+        with self.lock:
+            return {
+                'command': command,
+                'started': self.started.isoformat(timespec='seconds'),
+                'seconds': round(time.perf_counter() - self.start, 6),
+                'spans': { name: { 'count': span['count'], 'seconds': round(span['seconds'], 6), 'max': round(span['max'], 6) } for name, span in sorted(self.spans.items()) },
+                'counters': dict(sorted(self.counters.items()))
+            }
+
+    def save(self, path, command):
+        try:
+            writeJson(path, self.report(command))
+        except Exception as error:
+            print(f"Error writing the metrics file ({type(error).__name__}): {error}")
+
+# The metrics are shared by everything in the process
+metrics = Metrics()
+
+def getMetrics():
+    return metrics
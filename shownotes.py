@@ -0,0 +1,192 @@
+import re
+import json
+
+# Shownotes are cleaned by applying a table of rules in order. Each rule is a dictionary of one of these kinds:
+#
+# Regex substitution
+#   pattern:        regular expression
+#   replace:        replacement, which may refer to groups e.g. \1
+#   flags:          optional list of re flag names e.g. ["DOTALL", "MULTILINE"]
+#   guard:          optional list of literal strings that the pattern can't match without.
+#                   The rule is skipped, without scanning the text with its regex, if any of them is missing.
+#                   Guard searches are only repeated after a rule changes the text, so rules that share a guard
+#                   (e.g. the 'Support the channel' variants) cost one substring search between them.
+#
+# Literal removal, which is much cheaper than the equivalent regex because nothing backtracks
+#   remove-from:    remove from the first occurrence of this string...
+#   remove-to:      ...to the end of the last occurrence of this string, like the regex remove-from.*remove-to with DOTALL.
+#                   Without it, everything to the end of the text is removed.
+#   strip-before:   optional characters that are also removed from immediately before remove-from
+#
+# Built-in operation
+#   operation:      the name of a function in operations
+
+# Channel specific blocks removed before formatting.
+# Override them with the config setting "shownotes-rules": { "text": [ ... ], "html": [ ... ] }
+defaultRules = {
+    'text': [
+        # Remove 'Support the channel'
+        # 950+
+        { 'pattern': r"^[\*\-]+Support the channel[\*\-]+$.*enlites\.com/\n", 'replace': '', 'flags': ['DOTALL', 'MULTILINE'],
+            'guard': ['Support the channel', 'enlites.com/\n'] },
+        # 426-949
+        { 'remove-from': '------------------Support the channel------------', 'remove-to': 'enlites.com/\n' },
+        # Up to 167-391
+        { 'remove-from': '------------------Support the channel------------', 'remove-to': 'anchor.fm/thedissenter\n' },
+        # 1-145, 392-425
+        { 'remove-from': '------------------Support the channel------------', 'remove-to': 'twitter.com/TheDissenterYT\n' },
+    ],
+    'html': [
+        # Remove 'Support the channel'
+        # 950+
+        { 'pattern': r"<p>[\*\-]+Support the channel[\*\-]+</p>.*enlites\.com/</a></p>\n", 'replace': '', 'flags': ['DOTALL'],
+            'guard': ['Support the channel', 'enlites.com/</a></p>\n'] },
+        # 426 to 949
+        { 'remove-from': '<p>------------------Support the channel------------</p>', 'remove-to': 'enlites.com/</a></p>\n' },
+        # Up to 167-391
+        { 'remove-from': '<p>------------------Support the channel------------</p>', 'remove-to': 'anchor.fm/thedissenter</a></p>\n' },
+        # 1-145, 392-425
+        { 'remove-from': '<p>------------------Support the channel------------</p>', 'remove-to': 'twitter.com/TheDissenterYT</a></p>\n' },
+    ],
+}
+
+# Formatting applied after the channel specific rules
+formatRules = {
+    'text': [
+        # Remove whitespace from the start
+        { 'pattern': r'^[\n]*', 'replace': '' },
+        # Remove credits from the end
+        { 'remove-from': '\nA HUGE THANK YOU', 'strip-before': '-' },
+        # Horizontal rules
+        { 'pattern': r'\n *-[-]+ *\n', 'replace': '\n\n---\n\n', 'guard': ['--'] },
+        # Line breaks and time links
+        { 'operation': 'markdown-lines' },
+    ],
+    'html': [
+        # Remove blank lines from the start
+        # \xA0 is utf-8 non-breaking-space
+        { 'pattern': r"^<p>[ -\xA0]*</p>\n", 'replace': '' },
+        { 'pattern': r"^<p><br></p>\n", 'replace': '' },
+        { 'pattern': r"^\n", 'replace': '' },
+        # Remove credits from the end
+        { 'remove-from': '<p><a href="">A HUGE THANK YOU' },
+        { 'remove-from': '<p>A HUGE THANK YOU' },
+        # Remove blank lines from the end
+        { 'pattern': r'<p>[ -]*</p>\n$', 'replace': '', 'flags': ['DOTALL'], 'guard': ['</p>\n'] },
+        # Why doesn't this work? e.g. episode 457
+        { 'pattern': r'\n\n$', 'replace': '\n', 'guard': ['\n\n'] },
+    ],
+}
+
+timeLinkRegex = re.compile(r"(([0-9]{1,2}:)?[0-9]{2}:[0-9]{2}) *(.*)$")
+
+# Format the lines of plain text shownotes as markdown in a single pass. This is equivalent to:
+#   # Add 2 spaces before single line breaks, so they don't wrap
+#   re.sub(r'([^\n])\n([^\n])', r'\1  \n\2', text)
+#   # Wrap Time Links in time tags
+#   re.sub(r"^(([0-9]{1,2}:)?[0-9]{2}:[0-9]{2}) *(.*)$", r"<time>\1</time> \3", text, flags=re.MULTILINE)
+def MarkdownLines(text):
+    lines = text.split('\n')
+    out = []
+    # Was the line break before the current line given 2 spaces?
+    spaced = False
+    for index, line in enumerate(lines):
+        # The line break regex consumes the first character of the next line,
+        # so a single character line can't also have the line break after it spaced
+        spaced = index + 1 < len(lines) and line != '' and lines[index + 1] != '' and not (spaced and len(line) == 1)
+        if spaced:
+            line += '  '
+        if line[:1].isdigit():
+            match = timeLinkRegex.match(line)
+            if match:
+                line = '<time>' + match.group(1) + '</time> ' + match.group(3)
+        out.append(line)
+    return '\n'.join(out)
+
+operations = {
+    'markdown-lines': MarkdownLines,
+}
+
+class RegexRule():
+    def __init__(self, rule):
+        flags = 0
+        for flag in rule.get('flags', []):
+            flags |= getattr(re, flag)
+        self.regex = re.compile(rule['pattern'], flags)
+        self.replace = rule['replace']
+        self.guard = rule.get('guard', [])
+
+    # Return the new text and whether it changed
+    def apply(self, text):
+        text, count = self.regex.subn(self.replace, text)
+        return text, count > 0
+
+class RemoveRule():
+    def __init__(self, rule):
+        self.start = rule['remove-from']
+        self.end = rule.get('remove-to')
+        self.stripBefore = rule.get('strip-before', '')
+        self.guard = []
+
+    def apply(self, text):
+        start = text.find(self.start)
+        if start < 0:
+            return text, False
+        if self.end:
+            # The last occurrence, as found by a greedy .*
+            end = text.rfind(self.end)
+            if end < start + len(self.start):
+                return text, False
+            return text[:start] + text[end + len(self.end):], True
+        while start > 0 and text[start - 1] in self.stripBefore:
+            start -= 1
+        return text[:start], True
+
+class OperationRule():
+    def __init__(self, rule):
+        self.operation = operations[rule['operation']]
+        self.guard = []
+
+    def apply(self, text):
+        return self.operation(text), True
+
+def CompileRule(rule):
+    if 'pattern' in rule:
+        return RegexRule(rule)
+    if 'remove-from' in rule:
+        return RemoveRule(rule)
+    return OperationRule(rule)
+
+class ShownotesCleaner():
+    def __init__(self, rules):
+        self.rules = [CompileRule(rule) for rule in rules]
+
+    def clean(self, shownotes):
+        # Results of guard string searches on the current text
+        present = {}
+        for rule in self.rules:
+            skip = False
+            for literal in rule.guard:
+                if literal not in present:
+                    present[literal] = literal in shownotes
+                if not present[literal]:
+                    skip = True
+                    break
+            if not skip:
+                shownotes, changed = rule.apply(shownotes)
+                if changed:
+                    # Earlier searches no longer apply to the changed text
+                    present = {}
+        return shownotes
+
+# Cleaners are compiled once for each distinct rule table
+cleaners = {}
+
+# Get the cleaner for kind ('text' or 'html') shownotes using the rules in config
+def getShownotesCleaner(kind, config):
+    rules = config['shownotes-rules'][kind] if 'shownotes-rules' in config and kind in config['shownotes-rules'] else defaultRules[kind]
+    rules = rules + formatRules[kind]
+    key = kind + json.dumps(rules)
+    if key not in cleaners:
+        cleaners[key] = ShownotesCleaner(rules)
+    return cleaners[key]
@@ -1,5 +1,66 @@
+import re
+import sys
+import time
+import random
 import unittest
-from transcripttotext import DeUm
+from transcripttotext import DeUm, getUmRemover
+
+# The original implementation of DeUm, which DeUm must match
+def legacy_remove_first_um(text, um):
+    # Remove um from the beginning of the string
+    pattern = '^' + um + ',? ([A-Za-z0-9])'
+    text = re.sub(
+        re.compile(pattern,flags=re.IGNORECASE),
+        lambda pat: pat.group(1).upper(),
+        text)
+
+    # Remove um from the beginning of sentences i.e. after sentence ending punctuation
+    pattern = '([.?!:]) ' + um + ',? ([A-Za-z0-9])'
+    text = re.sub(
+        re.compile(pattern,flags=re.IGNORECASE),
+        lambda pat: pat.group(1) + ' ' + pat.group(2).upper(),
+        text)
+
+    # Replace comma-space-um-comma with comma
+    text = re.sub(', ' + um + ',', ',', text)
+
+    return text
+
+def legacy_remove_all_um(text, um):
+    # Replace space-um-space with space
+    text = re.sub(
+        re.compile(' ' + um + ',?(?= )', flags=re.IGNORECASE),
+        '',
+        text)
+
+    return text
+
+def LegacyDeUm(text, ums):
+    if ums is None or len(ums) == 0:
+        return text
+
+    new_length = len(text)
+    old_length = new_length + 1
+    while new_length < old_length:
+        old_length = new_length
+        for um in ums:
+            text = legacy_remove_first_um(text, um)
+        new_length = len(text)
+
+    for um in ums:
+        text = legacy_remove_all_um(text, um)
+
+    return text
+
+umLists = [['um'], ['um', 'uh'], ['um', 'uh', 'mhm'], ['uh', 'um', 'er'], ['um', 'umm'], ['umm', 'um'], ['Um', 'UH'], ['u[hm]', 'mhm']]
+
+# Random text made of words, ums in various cases, and punctuation, so the rules meet each other often
+def RandomText(rng, ums):
+    pieces = ['so', 'I', 'think', 'a', 'x', '9', 'yeah', 'mum', 'umbrella', 'hum'] + ums + [um.upper() for um in ums] + [um.capitalize() for um in ums]
+    words = []
+    for i in range(rng.randint(0, 20)):
+        words.append(rng.choice(pieces) + rng.choice(['', '', '', ',', '.', '?', '!', ':', ';']))
+    return rng.choice(['', ' ']) + ' '.join(words) + rng.choice(['', ' ', '.', ', '])
 
 class TestDeUm(unittest.TestCase):
 
@@ -18,5 +79,46 @@ class TestDeUm(unittest.TestCase):
 
         self.assertEqual(DeUm('Um er um er ha', ['um', 'er']), 'Ha')
 
+    def test_no_ums(self):
+        self.assertEqual(DeUm('Um ha', None), 'Um ha')
+        self.assertEqual(DeUm('Um ha', []), 'Um ha')
+        self.assertEqual(DeUm('', ['um']), '')
+        self.assertEqual(DeUm('Nothing to remove here', ['um', 'uh']), 'Nothing to remove here')
+
+    def test_cached(self):
+        self.assertIs(getUmRemover(['um', 'uh']), getUmRemover(['um', 'uh']))
+        self.assertIsNot(getUmRemover(['um', 'uh']), getUmRemover(['uh', 'um']))
+
+    def test_legacy(self):
+        rng = random.Random(0)
+        for i in range(20000):
+            ums = rng.choice(umLists)
+            text = RandomText(rng, ums)
+            self.assertEqual(DeUm(text, ums), LegacyDeUm(text, ums), f"{text!r} {ums}")
+
+# Time DeUm and the original implementation on turns of a synthetic transcript
+def Benchmark():
+    rng = random.Random(1)
+    ums = ['um', 'uh', 'mhm']
+    words = 'so I think that the question is really about how we know things and whether science can tell us anything about it'.split()
+    fillers = ['um', 'uh', 'Um', 'Uh', 'um,', 'uh,', 'mhm.']
+    turns = []
+    for i in range(2000):
+        turn = []
+        for j in range(rng.randint(5, 60)):
+            word = rng.choice(fillers) if rng.random() < 0.08 else rng.choice(words)
+            turn.append(word + ('.' if rng.random() < 0.08 else ''))
+        turns.append(' '.join(turn))
+
+    for name, function in (('legacy', LegacyDeUm), ('DeUm', DeUm)):
+        start = time.perf_counter()
+        for turn in turns:
+            function(turn, ums)
+        print(f"{name}: {len(turns)} turns {time.perf_counter() - start:.3f}s")
+
 if __name__ == '__main__':
+    # python test-deum.py --benchmark
+    if '--benchmark' in sys.argv:
+        sys.argv.remove('--benchmark')
+        Benchmark()
     unittest.main()
@@ -0,0 +1,126 @@
+import io
+import os
+import json
+import random
+import tempfile
+import unittest
+from createpages import WritePage
+from transcript import Transcript, FormatTime, AttributeSpeakers, loadTranscript
+from transcripttotext import transcriptToText
+from webvttUtils import getPhrasesFromTranscript, getTimeCode
+
+# Make a transcript of words, each a tuple of (content, start, end, speaker), or just the content for punctuation
+def MakeTranscript(words):
+    transcript = Transcript('test')
+    for word in words:
+        timed = not isinstance(word, str)
+        content, start, end, speaker = word if timed else (word, 0, 0, -1)
+        transcript.contents.append(content)
+        transcript.starts.append(start)
+        transcript.ends.append(end)
+        transcript.timed.append(timed)
+        transcript.punctuation.append(not timed)
+        transcript.speakers.append(speaker)
+    return transcript
+
+class TestAttributeSpeakers(unittest.TestCase):
+
+    # The speakers must be the same as looking each start time up in the labels, whatever order the labels and items are in
+    def test_lookup(self):
+        rng = random.Random(3)
+        for i in range(2000):
+            startTimes = [f"{rng.randint(0, 30) / rng.choice([1, 10, 100]):.{rng.choice([1, 2])}f}" for j in range(rng.randint(0, 20))]
+            labels = [{ 'start_time': startTime, 'speaker_label': f"spk_{rng.randint(0, 2)}" } for startTime in startTimes if rng.random() < 0.8]
+            labels += [{ 'start_time': rng.choice(startTimes), 'speaker_label': 'spk_3' } for j in range(rng.randint(0, 2)) if startTimes]
+            if rng.random() < 0.5:
+                startTimes.sort(key=float)
+            if rng.random() < 0.5:
+                labels.sort(key=lambda label: float(label['start_time']))
+            lookup = { label['start_time']: int(label['speaker_label'][4:]) for label in labels }
+            self.assertEqual(AttributeSpeakers(labels, startTimes), [lookup.get(startTime, -1) for startTime in startTimes], f"{labels} {startTimes}")
+
+class TestTranscriptToText(unittest.TestCase):
+
+    def test_unknown_speaker(self):
+        transcript = MakeTranscript([('Hello', 0, 1, 0), '.', ('Pardon', 2, 3, -1), '?', ('Hi', 4, 5, 1), '.'])
+        output = io.StringIO()
+        transcriptToText(transcript, { 'episodeid': '1', 'interviewee': ['Guest'] }, { 'defaults': { 'interviewer': ['Host'] } }, output)
+        self.assertEqual(output.getvalue(),
+            '<time>0:00:00</time> Host: Hello.\n\n'
+            '<time>0:00:02</time> Unknown speaker: Pardon?\n\n'
+            '<time>0:00:04</time> Guest: Hi.\n\n')
+
+class TestFormatTime(unittest.TestCase):
+
+    def test_format(self):
+        self.assertEqual(FormatTime(0), '00:00:00.000')
+        self.assertEqual(FormatTime(59999), '00:00:59.999')
+        self.assertEqual(FormatTime(3599999), '00:59:59.999')
+        self.assertEqual(FormatTime(3600000), '01:00:00.000')
+        self.assertEqual(FormatTime(3661001), '01:01:01.001')
+        self.assertEqual(FormatTime(36000000), '10:00:00.000')
+        self.assertEqual(FormatTime(360000000), '100:00:00.000')
+
+    def test_no_fraction(self):
+        self.assertEqual(FormatTime(0, False), '0:00:00')
+        self.assertEqual(FormatTime(3599999, False), '0:59:59')
+        self.assertEqual(FormatTime(3600000, False), '1:00:00')
+        self.assertEqual(FormatTime(36061000, False), '10:01:01')
+
+    def test_time_code(self):
+        self.assertEqual(getTimeCode(3599.9994), '00:59:59.999')
+        self.assertEqual(getTimeCode(3599.9996), '01:00:00.000')
+        self.assertEqual(getTimeCode(3725.5), '01:02:05.500')
+
+class TestCaptions(unittest.TestCase):
+
+    def test_cue_times(self):
+        rng = random.Random(2)
+        words = []
+        for i in range(500):
+            words.append((rng.choice(['a', 'so', 'question', 'epistemology']), i, i + rng.choice([0.2, 0.5, 3]), 0))
+            if rng.random() < 0.2:
+                words.append(rng.choice(['.', ',', '?']))
+        # A full stop after the last full cue
+        words = words[:-1] + [('end', 501, 502, 0)] * (10 - len(words) % 10) + ['.']
+        transcript = MakeTranscript(words)
+        for limits in ({ 'words': 10 }, { 'words': None, 'characters': 12 }, { 'words': None, 'seconds': 2 }, { 'words': 1 }):
+            phrases = list(getPhrasesFromTranscript(transcript, limits))
+            self.assertTrue(phrases)
+            for phrase in phrases:
+                self.assertTrue(phrase['start_time'], f"{limits} {phrase}")
+                self.assertTrue(phrase['end_time'], f"{limits} {phrase}")
+            self.assertEqual(sum(len(phrase['words']) for phrase in phrases), len(transcript))
+
+class TestEmptyTranscript(unittest.TestCase):
+
+    # An episode with a transcript of no items still gets captions and a transcript section
+    def test_page(self):
+        with tempfile.TemporaryDirectory() as folder:
+            config = {
+                'episode-folder': os.path.join(folder, 'episode'),
+                'page-folder': os.path.join(folder, 'page'),
+                'vtt-folder': os.path.join(folder, 'vtt'),
+                'defaults': { 'interviewer': ['Host'] }
+            }
+            for name in ('page-folder', 'vtt-folder'):
+                os.makedirs(config[name])
+            os.makedirs(os.path.join(config['episode-folder'], '1'))
+            transcriptPath = os.path.join(config['episode-folder'], '1', 'transcript.json')
+            with open(transcriptPath, 'w', encoding='utf-8') as file:
+                json.dump({ 'results': { 'transcripts': [{ 'transcript': '' }], 'items': [] } }, file)
+            self.assertEqual(len(loadTranscript(transcriptPath)), 0)
+
+            dataDict = { 'episodeid': '1', 'filename': 'episode-1', 'title': 'Episode 1', 'interviewee': ['Guest'], 'shownotes': 'Notes\n' }
+            outputs = WritePage(dataDict, -1, config, {})
+            vttpath = os.path.join(config['vtt-folder'], '1.vtt')
+            self.assertEqual(outputs, [os.path.join(config['page-folder'], 'episode-1.md'), vttpath])
+            self.assertTrue(os.path.isfile(vttpath))
+            with open(outputs[0], 'r', encoding='utf-8') as file:
+                page = file.read()
+            self.assertIn('"vtt": "1.vtt"', page)
+            self.assertIn('## Transcript\n', page)
+            self.assertNotIn('Unknown speaker', page)
+
+if __name__ == '__main__':
+    unittest.main()
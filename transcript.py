@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+from metrics import getMetrics
+
+# The parts of an AWS Transcribe transcript needed to generate captions and text,
+# decoded once from the JSON into one compact column per field, rather than a dictionary per item
+class Transcript():
+    __slots__ = ('path', 'contents', 'starts', 'ends', 'timed', 'punctuation', 'speakers')
+
+    def __init__(self, path):
+        self.path = path
+        # For each item, i.e. each word or punctuation mark
+        # Interned, so repeated words share one string
+        self.contents = []
+        # Start and end times in seconds, or 0 if the item isn't timed
+        self.starts = array('d')
+        self.ends = array('d')
+        # 1 if the item has a start and end time, i.e. it isn't punctuation
+        self.timed = array('B')
+        # 1 if the item is punctuation
+        self.punctuation = array('B')
+        # Speaker number, or -1 if the item isn't timed
+        self.speakers = array('h')
+
+    def __len__(self):
+        return len(self.contents)
+
+# Two and three digit strings of the numbers, for formatting times without a format call per field
+twoDigits = [f"{i:02d}" for i in range(100)]
+threeDigits = [f"{i:03d}" for i in range(1000)]
+
+# Format a time in whole milliseconds as HH:MM:SS.mmm, as used in WebVTT files
+# Without the milliseconds, it's formatted as H:MM:SS, as used for time links
+def FormatTime(milliseconds, fraction=True):
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if fraction:
+        return (twoDigits[hours] if hours < 100 else str(hours)) + ':' + twoDigits[minutes] + ':' + twoDigits[seconds] + '.' + threeDigits[milliseconds]
+    return str(hours) + ':' + twoDigits[minutes] + ':' + twoDigits[seconds]
+
+# The decoded transcript is cached next to the JSON file, e.g. transcript.bin, in a fixed binary layout:
+#   header          magic, version, byte order, item count, mtime and size of the JSON file it was decoded from
+#   starts, ends    item count doubles each
+#   speakers        item count int16
+#   timed           item count bytes
+#   punctuation     item count bytes
+#   contents        the items' text, utf-8 encoded and separated by \0
+# The columns are read straight out of the memory mapped file. The cache is rebuilt when the JSON file's mtime or size changes.
+cacheMagic = b'TSCR'
+cacheVersion = 1
+cacheHeader = struct.Struct('<4sHHIqq')
+
+def CachePath(path):
+    return os.path.splitext(path)[0] + '.bin'
+
+# Decode the AWS Transcribe JSON file at path, using the binary cache if it is up to date
+def loadTranscript(path, cache=True):
+    metrics = getMetrics()
+    with metrics.span('transcript.load'):
+        if cache:
+            stat = os.stat(path)
+            transcript = ReadCache(path, stat)
+            if transcript is None:
+                metrics.count('transcript.cache-misses')
+                transcript = DecodeTranscript(path)
+                WriteCache(transcript, stat)
+            else:
+                metrics.count('transcript.cache-hits')
+            return transcript
+        return DecodeTranscript(path)
+
+def DecodeTranscript(path):
+    with open(path, mode='r', encoding='utf-8') as file:
+        data = json.load(file)
+    results = data['results']
+
+    transcript = Transcript(path)
+    items = results['items']
+    transcript.contents = [sys.intern(item['alternatives'][0]['content']) for item in items]
+    transcript.timed = array('B', [1 if item.get('start_time') else 0 for item in items])
+    transcript.punctuation = array('B', [item['type'] == 'punctuation' for item in items])
+    # Start time strings of the timed items, which identify them in the speaker labels
+    startTimes = [item['start_time'] for item in items if item.get('start_time')]
+    transcript.starts = array('d', [float(item['start_time']) if item.get('start_time') else 0 for item in items])
+    transcript.ends = array('d', [float(item['end_time']) if item.get('start_time') else 0 for item in items])
+
+    labels = [label for segment in results['speaker_labels']['segments'] for label in segment['items']] if 'speaker_labels' in results else []
+    speakers = iter(AttributeSpeakers(labels, startTimes))
+    transcript.speakers = array('h', [next(speakers) if timed else -1 for timed in transcript.timed])
+    return transcript
+
+# Get the speaker number of each start time, from the speaker labels' items, or -1 if it isn't labelled
+# If a start time is labelled more than once, the last label is used
+def AttributeSpeakers(labels, startTimes):
+    labelStarts = [float(label['start_time']) for label in labels]
+    # e.g. spk_0
+    labelSpeakers = [int(label['speaker_label'][4:]) for label in labels]
+
+    starts = [float(startTime) for startTime in startTimes]
+
+    if any(labelStarts[i] > labelStarts[i + 1] for i in range(len(labelStarts) - 1)) \
+            or any(starts[i] > starts[i + 1] for i in range(len(starts) - 1)):
+        # The labels or the items are out of time order, so look the start times up instead
+        speakerStartTimes = { label['start_time']: speaker for label, speaker in zip(labels, labelSpeakers) }
+        return [speakerStartTimes.get(startTime, -1) for startTime in startTimes]
+
+    # Both lists are in time order, so merge them, advancing through the labels as the start times increase
+    speakers = []
+    j = 0
+    for startTime, start in zip(startTimes, starts):
+        while j < len(labels) and labelStarts[j] < start:
+            j += 1
+        speaker = -1
+        # Compare the strings too, as the lookup by start time does
+        k = j
+        while k < len(labels) and labelStarts[k] == start:
+            if labels[k]['start_time'] == startTime:
+                speaker = labelSpeakers[k]
+            k += 1
+        speakers.append(speaker)
+    return speakers
+
+def ReadCache(path, stat):
+    cachePath = CachePath(path)
+    if not os.path.isfile(cachePath):
+        return None
+    try:
+        with open(cachePath, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            magic, version, littleEndian, count, mtime, size = cacheHeader.unpack_from(buffer, 0)
+            if magic != cacheMagic or version != cacheVersion or littleEndian != (sys.byteorder == 'little') \
+                    or mtime != stat.st_mtime_ns or size != stat.st_size:
+                return None
+
+            transcript = Transcript(path)
+            offset = cacheHeader.size
+            for column in (transcript.starts, transcript.ends, transcript.speakers, transcript.timed, transcript.punctuation):
+                end = offset + count * column.itemsize
+                column.frombytes(buffer[offset:end])
+                offset = end
+            if count:
+                transcript.contents = [sys.intern(content) for content in str(buffer[offset:], 'utf-8').split('\0')]
+            if len(transcript.contents) != count:
+                return None
+            return transcript
+    except Exception as error:
+        print(f"Error reading the transcript cache {cachePath} ({type(error).__name__}): {error}")
+        return None
+
+# Write the cache to a temporary file and rename it, so a page build running at the same time never reads half a file
+def WriteCache(transcript, stat):
+    cachePath = CachePath(transcript.path)
+    temppath = cachePath + '.tmp'
+    try:
+        with open(temppath, 'wb') as file:
+            file.write(cacheHeader.pack(cacheMagic, cacheVersion, sys.byteorder == 'little', len(transcript), stat.st_mtime_ns, stat.st_size))
+            for column in (transcript.starts, transcript.ends, transcript.speakers, transcript.timed, transcript.punctuation):
+                column.tofile(file)
+            file.write('\0'.join(transcript.contents).encode('utf-8'))
+        os.replace(temppath, cachePath)
+    except Exception as error:
+        print(f"Error writing the transcript cache {cachePath} ({type(error).__name__}): {error}")
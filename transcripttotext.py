@@ -1,38 +1,62 @@
-import datetime
 import re
-import json
-import codecs
-
-# Remove um at the start of a sentence, and capitalise the next word
-def remove_first_um(text, um):
-    # Remove um from the beginning of the string
-    pattern = '^' + um + ',? ([A-Za-z0-9])'
-    text = re.sub(
-        re.compile(pattern,flags=re.IGNORECASE),
-        lambda pat: pat.group(1).upper(),
-        text)
-
-    # Remove um from the beginning of sentences i.e. after sentence ending punctuation
-    pattern = '([.?!:]) ' + um + ',? ([A-Za-z0-9])'
-    text = re.sub(
-        re.compile(pattern,flags=re.IGNORECASE),
-        lambda pat: pat.group(1) + ' ' + pat.group(2).upper(),
-        text)
-
-    # Replace comma-space-um-comma with comma
-    text = re.sub(', ' + um + ',', ',', text)
-
-    return text
-
-# Remove all Ums
-def remove_all_um(text, um):
-    # Replace space-um-space with space
-    text = re.sub(
-        re.compile(' ' + um + ',?(?= )', flags=re.IGNORECASE),
-        '',
-        text)
-
-    return text
+from transcript import loadTranscript, FormatTime
+from metrics import getMetrics
+
+# Removes a list of ums, i.e. filler words, from text
+# The rules are:
+#   a) Remove um from the beginning of the text, and capitalise the next word
+#   b) Remove um from the beginning of sentences i.e. after sentence ending punctuation, and capitalise the next word
+#   c) Replace comma-space-um-comma with comma
+# which are applied for each um in turn, and repeated until none are removed, as removing one um can leave another at the start of a sentence, then
+#   d) Replace space-um-space with space
+# The patterns are compiled once. The order the rules are applied in can change the result, so a-c are applied one um at a time,
+# but a single search of an alternation over all the ums decides whether another round is needed.
+class UmRemover():
+    def __init__(self, ums):
+        self.rules = []
+        for um in ums:
+            self.rules.append((
+                re.compile('^' + um + ',? ([A-Za-z0-9])', flags=re.IGNORECASE),
+                re.compile('([.?!:]) ' + um + ',? ([A-Za-z0-9])', flags=re.IGNORECASE),
+                re.compile(', ' + um + ',')
+            ))
+
+        # Each um is itself a regular expression
+        anyUm = '(?:' + '|'.join('(?:' + um + ')' for um in ums) + ')'
+        # Text without any ums is returned without applying the rules
+        self.anyUm = re.compile(anyUm, flags=re.IGNORECASE)
+        # Matches if any of rules a-c would remove an um
+        self.anyRule = re.compile('(?i:^' + anyUm + ',? [A-Za-z0-9])|(?i:[.?!:] ' + anyUm + ',? [A-Za-z0-9])|, ' + anyUm + ',')
+
+        # Removing a word um can't create or break a match of another word um, so rule d can be applied for all of them at once
+        if all(re.fullmatch(r'\w+', um) for um in ums):
+            self.allUms = [re.compile(' ' + anyUm + ',?(?= )', flags=re.IGNORECASE)]
+        else:
+            self.allUms = [re.compile(' ' + um + ',?(?= )', flags=re.IGNORECASE) for um in ums]
+
+    def remove(self, text):
+        if not self.anyUm.search(text):
+            return text
+
+        # Keep removing ums from the start of sentences until none are removed
+        while self.anyRule.search(text):
+            for firstUm, sentenceUm, commaUm in self.rules:
+                text = firstUm.sub(lambda pat: pat.group(1).upper(), text)
+                text = sentenceUm.sub(lambda pat: pat.group(1) + ' ' + pat.group(2).upper(), text)
+                text = commaUm.sub(',', text)
+
+        for allUm in self.allUms:
+            text = allUm.sub('', text)
+        return text
+
+# Removers are compiled once for each list of ums
+umRemovers = {}
+
+def getUmRemover(ums):
+    key = tuple(ums)
+    if key not in umRemovers:
+        umRemovers[key] = UmRemover(ums)
+    return umRemovers[key]
 
 # Remove ums from the given text
 def DeUm(text, ums):
@@ -40,19 +64,7 @@ def DeUm(text, ums):
         # Nothing to do
         return text
 
-    # Keep removing ums from the start of sentences until none are removed
-    new_length = len(text)
-    old_length = new_length + 1
-    while new_length < old_length:
-        old_length = new_length
-        for um in ums:
-            text = remove_first_um(text, um)
-        new_length = len(text)
-
-    for um in ums:
-        text = remove_all_um(text, um)
-
-    return text
+    return getUmRemover(ums).remove(text)
 
 # def getEpisodeID(filename):
 #     # match = re.search("^([^-]+)-", filename) 
@@ -71,64 +83,104 @@ def DeUm(text, ums):
 #     # TODO: catch item not found
 #     return dataDict['interviewee']
 
+# Split the transcript into turns, i.e. consecutive items with the same speaker
+# Returns a list of { speaker, line, time }
+# Each turn's words are collected in a list and joined once, so the cost is linear in the length of the turn
+def TranscriptTurns(transcript):
+    contents = transcript.contents
+    timed = transcript.timed
+    punctuation = transcript.punctuation
+    speakers = transcript.speakers
+    starts = transcript.starts
+
+    lines=[]
+    # A transcript of no items has no turns
+    if len(transcript) == 0:
+        return lines
+    words=[]
+    time=0
+    speaker=None
+    current_speaker=None
+    for i in range(len(transcript)):
+        content = contents[i]
+        if timed[i]:
+            current_speaker=speakers[i]
+        elif punctuation[i]:
+            # Punctuation is attached to the previous word
+            words.append(content)
+        if current_speaker != speaker:
+            if speaker is not None:
+                lines.append({'speaker':speaker, 'line':''.join(words), 'time':time})
+            words=[content]
+            speaker=current_speaker
+            time=starts[i]
+        elif not punctuation[i]:
+            words.append(' ')
+            words.append(content)
+    lines.append({'speaker':speaker, 'line':''.join(words),'time':time})
+    return lines
+
+# The name written for the turns of items that aren't attributed to a speaker
+unknownSpeaker = 'Unknown speaker'
+
+# Get the name of speaker number speaker, which is -1 (or None if the transcript has no timed items) if it isn't known
+# -1 must not be used as an index, as it would attribute the turn to the last speaker
+def SpeakerName(speakers, speaker):
+    if speaker is None or speaker < 0:
+        return unknownSpeaker
+    return speakers[speaker]
+
+# Get the episode specific config, as a dictionary of episodeid: episode config
+# Build it once and pass it to transcriptToText, rather than searching the list in the config for every episode
+def EpisodeOverrides(config):
+    overrides = {}
+    for episode in config["episodes"] if "episodes" in config else []:
+        if episode['episodeid'] in overrides:
+            # The first is used, as before
+            print(f"WARNING: Duplicate episode config for episode {episode['episodeid']}")
+        else:
+            overrides[episode['episodeid']] = episode
+    return overrides
+
 # See https://github.com/faangbait/aws-transcribe-transcript
-def transcriptToText(inputFilename, dataDict, config, outputfile):
+# transcript is either a Transcript or the path of the AWS Transcribe JSON file
+# overrides is the result of EpisodeOverrides(config), which is built here if it isn't given
+def transcriptToText(transcript, dataDict, config, outputfile, overrides=None):
 
     # ums = ['um', 'uh', 'mhm']
     ums = config['ums'] if 'ums' in config else None
 
+    if overrides is None:
+        overrides = EpisodeOverrides(config)
+
     # If there is episode specific config, and this episode is present, then find it
-    episode = [episode for episode in config["episodes"] if episode['episodeid']==dataDict['episodeid']] if "episodes" in config else []
-    # TODO: Check that episode contains 1 item
-    if len(episode) == 0:
+    episode = overrides.get(dataDict['episodeid'])
+    if episode is None:
         # There is no config for this episode. Get the speakers from the title.
         speakers = dataDict['interviewee']
     else:
-        # TODO: if len(episode)>1: warn about duplicate episode config
-        speakers = speakers + episode[0]["interviewee"]
+        # The episode config replaces the speakers from the title
+        speakers = episode["interviewee"]
 
     speakers = config["defaults"]["interviewer"] + speakers
 
     # outputFilename = os.path.basename(inputFilename) + ".txt"
     #outputFilename = re.sub(r"\.[^.]*$", ".md", inputFilename)
 
-    print ("Converting transcript file: ", inputFilename)
-    with codecs.open(inputFilename, 'r', 'utf-8') as inputfile:
-        data=json.loads(inputfile.read())
-        labels = data['results']['speaker_labels']['segments']
-        speaker_start_times={}
-        for label in labels:
-            for item in label['items']:
-                #speaker_start_times[item['start_time']] =item['speaker_label']
-                speaker_start_times[item['start_time']] = int(item['speaker_label'][4:])
-                #print(int(item['speaker_label'][4:]))
-        #print(speaker_start_times)
-        items = data['results']['items']
-        lines=[]
-        line=''
-        time=0
-        speaker=None
-        i=0
-        for item in items:
-            i=i+1
-            content = item['alternatives'][0]['content']
-            if item.get('start_time'):
-                current_speaker=speaker_start_times[item['start_time']]
-            elif item['type'] == 'punctuation':
-                line = line+content
-            if current_speaker != speaker:
-                if speaker is not None:
-                    lines.append({'speaker':speaker, 'line':line, 'time':time})
-                line=content
-                speaker=current_speaker
-                time=item['start_time']
-            elif item['type'] != 'punctuation':
-                line = line + ' ' + content
-        lines.append({'speaker':speaker, 'line':line,'time':time})
-        sorted_lines = sorted(lines,key=lambda k: float(k['time']))
-        for line_data in sorted_lines:
-            outputfile.write('<time>' + str(datetime.timedelta(seconds=int(round(float(line_data['time']))))) + '</time> ' \
-                + speakers[line_data.get('speaker')] + ': ' \
+    if isinstance(transcript, str):
+        transcript = loadTranscript(transcript)
+
+    print ("Converting transcript file: ", transcript.path)
+    metrics = getMetrics()
+    with metrics.span('transcript.text'):
+        lines = TranscriptTurns(transcript)
+        # Transcribe items are in time order, so the turns normally are too and don't need sorting
+        if any(lines[i]['time'] > lines[i + 1]['time'] for i in range(len(lines) - 1)):
+            lines = sorted(lines,key=lambda k: k['time'])
+        for line_data in lines:
+            outputfile.write('<time>' + FormatTime(int(round(line_data['time'])) * 1000, False) + '</time> ' \
+                + SpeakerName(speakers, line_data.get('speaker')) + ': ' \
                 + DeUm(line_data.get('line'), ums) \
                 + '\n\n'
             )
+    metrics.count('transcript.turns', len(lines))
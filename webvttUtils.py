@@ -1,30 +1,37 @@
 ﻿# Adapted from https://github.com/aws-samples/aws-transcribe-captioning-tools/tree/master/tools
 
-import json
 # import boto3
-import re
-import io
+from transcript import loadTranscript, FormatTime
+from metrics import getMetrics
 # from audioUtils import *
 
 # translate = boto3.client(service_name='translate', region_name='us-east-1', use_ssl=True)
 
 # Create a new phrase structure
+# punctuation holds a flag for each word, which is True if it is attached to the previous word without a space
 def newPhrase():
-	return { 'start_time': '', 'end_time': '', 'words' : [] }
+	return { 'start_time': '', 'end_time': '', 'words' : [], 'punctuation': [] }
 
-# Format and return a string that contains the converted number of seconds into WebVTT format
+# The limits on the length of each caption cue. A cue ends when any of them is reached.
+#   words:		number of words, including punctuation
+#   characters:	length of the cue's text. The cue ends before the word that would make it longer.
+#   			Punctuation stays with the word before it, so it can take the cue over the limit.
+#   seconds:	time from the start of the first word to the end of the last. The cue ends before the word that would make it longer.
+# Override them with the config setting "caption-limits": { "words": 10, "characters": 80, "seconds": 6 }
+defaultCueLimits = { 'words': 10, 'characters': None, 'seconds': None }
+
+# Format and return a string that contains the converted number of seconds into WebVTT format i.e. HH:MM:SS.mmm
 def getTimeCode( seconds ):
-	t_hund = int(seconds % 1 * 1000)
-	t_seconds = int( seconds )
-	t_secs = ((float( t_seconds) / 60) % 1) * 60
-	t_mins = int( t_seconds / 60 )
-	return str( "%02d:%02d:%02d.%03d" % (00, t_mins, int(t_secs), t_hund ))
+	return FormatTime( int( round( seconds * 1000 ) ) )
 	
-def writeTranscriptToWebVTT( transcript, sourceLangCode, WebVTTFileName ):
+# transcript is either a Transcript or the path of the AWS Transcribe JSON file
+# The cues are written as they are formed, so only one or two are held in memory at a time
+def writeTranscriptToWebVTT( transcript, sourceLangCode, WebVTTFileName, cueLimits=None ):
 	# Write the WebVTT file for the original language
 	#print( "==> Creating WebVTT from transcript", transcript)
-	phrases = getPhrasesFromTranscript( transcript )
-	writeWebVTT( phrases, WebVTTFileName, "A:middle L:90%" )
+	with getMetrics().span( 'transcript.vtt' ):
+		phrases = getPhrasesFromTranscript( transcript, cueLimits )
+		writeWebVTT( phrases, WebVTTFileName, "A:middle L:90%" )
 
 # def writeTranslationToWebVTT( transcript, sourceLangCode, targetLangCode, WebVTTFileName ):
 # 	# First get the translation
@@ -88,59 +95,96 @@ def writeTranscriptToWebVTT( transcript, sourceLangCode, WebVTTFileName ):
 			
 # 	return phrases
 
-def getPhrasesFromTranscript( transcript ):
+# Generate the phrases, i.e. caption cues, of the transcript, within the limits in cueLimits
+# Punctuation counts towards the words limit, so a phrase can be only punctuation, e.g. the full stop at the end of the transcript.
+# It has no times, so it's added to the phrase next to it.
+def getPhrasesFromTranscript( transcript, cueLimits=None ):
+	previous = None
+	for phrase in formPhrases( transcript, cueLimits ):
+		if previous is None:
+			previous = phrase
+		elif not phrase["start_time"] or not previous["start_time"]:
+			previous["words"].extend( phrase["words"] )
+			previous["punctuation"].extend( phrase["punctuation"] )
+			previous["start_time"] = previous["start_time"] or phrase["start_time"]
+			previous["end_time"] = phrase["end_time"] or previous["end_time"]
+		else:
+			yield previous
+			previous = phrase
+	if previous is not None:
+		yield previous
+
+# Generate the phrases for getPhrasesFromTranscript, some of which may be only punctuation
+def formPhrases( transcript, cueLimits ):
 
 	# This function is intended to be called with the JSON structure output from the Transcribe service.  However,
 	# if you only have the translation of the transcript, then you should call getPhrasesFromTranslation instead
 
 	# Now create phrases from the translation
-	with open(transcript, mode='r', encoding='utf-8') as transcriptfile:
-		ts = json.load( transcriptfile )
-	items = ts['results']['items']
-	#print( items )
+	if isinstance( transcript, str ):
+		transcript = loadTranscript( transcript )
+
+	limits = dict( defaultCueLimits, **( cueLimits or {} ) )
+	maxWords = limits['words']
+	maxCharacters = limits['characters']
+	maxSeconds = limits['seconds']
 	
 	#set up some variables for the first pass
 	phrase =  newPhrase()
-	phrases = []
 	nPhrase = True
 	x = 0
-	c = 0
+	# Length of the phrase's text, and start time of its first word
+	characters = 0
+	start = None
 
 	#print("==> Creating phrases from transcript...")
 
-	for item in items:
+	for i in range( len( transcript ) ):
+		word = transcript.contents[i]
+		punctuation = transcript.punctuation[i]
+
+		# end the phrase before a word that would take it past the character or duration limits
+		if x > 0 and not punctuation and (
+			( maxCharacters and characters + 1 + len( word ) > maxCharacters ) or
+			( maxSeconds and start is not None and transcript.ends[i] - start > maxSeconds )
+		):
+			yield phrase
+			phrase = newPhrase()
+			nPhrase = True
+			x = 0
+			characters = 0
+			start = None
 
 		# if it is a new phrase, then get the start_time of the first item
-		if nPhrase == True:
-			if item["type"] == "pronunciation":
-				phrase["start_time"] = getTimeCode( float(item["start_time"]) )
-				nPhrase = False
-			c+= 1
-		else:	
-			# get the end_time if the item is a pronuciation and store it
-			# We need to determine if this pronunciation or puncuation here
-			# Punctuation doesn't contain timing information, so we'll want
-			# to set the end_time to whatever the last word in the phrase is.
-			if item["type"] == "pronunciation":
-				phrase["end_time"] = getTimeCode( float(item["end_time"]) )
+		if nPhrase == True and not punctuation:
+			phrase["start_time"] = getTimeCode( transcript.starts[i] )
+			start = transcript.starts[i]
+			nPhrase = False
+
+		# get the end_time if the item is a pronuciation and store it, including the first, so a phrase of one word has an end_time
+		# Punctuation doesn't contain timing information, so we'll want
+		# to set the end_time to whatever the last word in the phrase is.
+		if not punctuation:
+			phrase["end_time"] = getTimeCode( transcript.ends[i] )
 				
 		# in either case, append the word to the phrase...
-		phrase["words"].append(item['alternatives'][0]["content"])
+		phrase["words"].append( word )
+		phrase["punctuation"].append( punctuation )
+		characters += len( word ) if x == 0 or punctuation else 1 + len( word )
 		x += 1
 		
 		# now add the phrase to the phrases, generate a new phrase, etc.
-		if x == 10:
-			#print c, phrase
-			phrases.append(phrase)
+		if x == maxWords:
+			yield phrase
 			phrase = newPhrase()
 			nPhrase = True
 			x = 0
+			characters = 0
+			start = None
 	
 	# if there are any words in the final phrase add to phrases
 	if(len(phrase["words"]) > 0):
-		phrases.append(phrase)	
-			
-	return phrases
+		yield phrase
 
 # def translateTranscript( transcript, sourceLangCode, targetLangCode ):
 # 	# Get the translation in the target language.  We want to do this first so that the translation is in the full context
@@ -162,51 +206,40 @@ def writeWebVTT( phrases, filename, style ):
 	#print("==> Writing phrases to disk...")
 
 	# open the files
-	e = open(filename, 'w+', encoding='utf-8')
-	x = 1
+	with open(filename, 'w', encoding='utf-8') as e:
+		x = 1
 	
-	# write the header of the webVTT file
-	e.write( "WEBVTT\n\n")
+		# write the header of the webVTT file
+		e.write( "WEBVTT\n\n")
 	
-	for phrase in phrases:
+		# phrases may be a generator, so each phrase is written as soon as it is formed
+		for phrase in phrases:
 
-		# determine how many words are in the phrase
-		length = len(phrase["words"])
+			# write out the phrase number
+			e.write( str(x) + "\n" )
+			x += 1
 		
-		# write out the phrase number
-		e.write( str(x) + "\n" )
-		x += 1
-		
-		# write out the start and end time
-		#e.write( phrase["start_time"] + " --> " + phrase["end_time"] + " " + style + "\n" )
-		# inCharge - Don't include style, because it causes videojs to fail
-		e.write( phrase["start_time"] + " --> " + phrase["end_time"] + "\n" )
+			# write out the start and end time
+			#e.write( phrase["start_time"] + " --> " + phrase["end_time"] + " " + style + "\n" )
+			# inCharge - Don't include style, because it causes videojs to fail
+			e.write( phrase["start_time"] + " --> " + phrase["end_time"] + "\n" )
 					
-		# write out the full phase.  Use spacing if it is a word, or punctuation without spacing
-		out = getPhraseText( phrase )
-
-		# write out the WebVTT file
-		e.write(out + "\n\n" )
-		
+			# write out the full phase.  Use spacing if it is a word, or punctuation without spacing
+			out = getPhraseText( phrase )
 
-		#print out
-		
-	e.close()
+			# write out the WebVTT file
+			e.write(out + "\n\n" )
 
 def getPhraseText( phrase ):
-
-	length = len(phrase["words"])
-		
-	out = ""
-	for i in range( 0, length ):
-		if re.match( '[a-zA-Z0-9]', phrase["words"][i]):
-			if i > 0:
-				out += " " + phrase["words"][i]
-			else:
-				out += phrase["words"][i]
-		else:
-			out += phrase["words"][i]
+	words = phrase["words"]
+	punctuation = phrase["punctuation"]
+
+	out = []
+	for i in range( len( words ) ):
+		if i > 0 and not punctuation[i]:
+			out.append( " " )
+		out.append( words[i] )
 			
-	return out
+	return "".join( out )
 
 	
\ No newline at end of file
@@ -1,58 +1,107 @@
 import os
-import json
-from urllib.parse import urlparse, parse_qs
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 # https://pypi.org/project/google-api-python-client/
 # https://github.com/googleapis/google-api-python-client/blob/main/docs/README.md
 from googleapiclient.discovery import build, Resource
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 
-# Construct a filename from the relevant parameters
-def getTestPath(url, testPath, testSet, params):
-    urlParts = urlparse(url)
-    queryParts = parse_qs(urlParts.query)
-    call = os.path.basename(urlParts.path)
-    path = os.path.abspath( os.path.join(testPath, testSet, call) )
-    filename = ''
-    for param in params:
-        # Parameter values are truncated to 34 characters to avoid exceeding maximum length
-        filename += (''.join(queryParts[param])[:34] if param in queryParts else '-') + '.'
-    if not os.path.exists(path):
-        os.makedirs(path)
-    return os.path.join(path, filename + 'json')
+from cassette import getCassette
+from metrics import getMetrics
+
+# Quota units charged for each call, by method id
+# https://developers.google.com/youtube/v3/determine_quota_cost
+quotaCosts = {
+    'youtube.search.list': 100,
+}
+defaultQuotaCost = 1
+
+# The url of a request without the API key, which identifies the request in the cassette, and mustn't be recorded
+def getRecordedUrl(url):
+    urlParts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(urlParts.query, keep_blank_values=True) if name != 'key']
+    return urlunsplit(urlParts._replace(query=urlencode(query)))
 
 class YouTubeAPI():
     def __init__(self, config):
         self.config = config
-        apiKey = os.environ['GOOGLE_API_KEY']
+        # Replaying recorded responses doesn't need a real key, but without one the client looks for other credentials
+        self.cassette = getCassette(config)
+        apiKey = os.environ['GOOGLE_API_KEY'] if self.cassette is None or self.cassette.recording() else os.environ.get('GOOGLE_API_KEY', 'replay')
         self.youtube = build('youtube', 'v3', developerKey=apiKey)
 
-    def execute(self, request, params):
-        if 'test' in self.config:
-            # Test data is being loaded or saved - The path is needed in both cases
-            path = getTestPath(request.uri, self.config["test-path"], 'youtube', params)
-            if self.config['test'] == 'load':
-                # Loading test data
-                if os.path.exists(path):
-                    # Load test data from file
-                    with open(path, mode='r', encoding='utf-8') as file:
-                        response = json.load(file)
+        # Independent requests, e.g. the pages of different playlists, are run on a pool of threads
+        # httplib2 isn't thread safe, so each thread has its own connection
+        self.executor = ThreadPoolExecutor(max_workers=config['youtube-jobs'] if 'youtube-jobs' in config else 8)
+        self.local = threading.local()
+        # Requests that fail with a 5xx or rate limit error are retried this many times, with exponential backoff
+        self.retries = config['youtube-retries'] if 'youtube-retries' in config else 5
+
+        # Dictionary of method id: { requests, units }
+        self.quota = {}
+        self.quotaLock = threading.Lock()
+
+    # Call function for each item on the thread pool, and return the results in order
+    def map(self, function, items):
+        return list(self.executor.map(function, items))
+
+    def http(self):
+        if not hasattr(self.local, 'http'):
+            self.local.http = build_http()
+        return self.local.http
+
+    # Count the quota used by a request. Retries aren't counted, although they are also charged.
+    def chargeQuota(self, request):
+        units = quotaCosts[request.methodId] if request.methodId in quotaCosts else defaultQuotaCost
+        with self.quotaLock:
+            quota = self.quota.setdefault(request.methodId, { 'requests': 0, 'units': 0 })
+            quota['requests'] += 1
+            quota['units'] += units
+        getMetrics().count('youtube.quota', units)
+
+    def printQuota(self):
+        if self.quota:
+            print(f"YouTube API quota used: {sum(quota['units'] for quota in self.quota.values())} units")
+            for methodId, quota in sorted(self.quota.items()):
+                print(f"\t{methodId}: {quota['requests']} requests, {quota['units']} units")
+
+    # If etag is given, the request is conditional, and None is returned if the response hasn't changed since that etag
+    # In test mode the response is recorded to or replayed from the cassette, in full, and the etag is compared with the recorded one
+    def execute(self, request, etag=None):
+        metrics = getMetrics()
+        metrics.count('youtube.requests')
+        with metrics.span('youtube.request'):
+            if self.cassette:
+                recorded = { 'method': request.method, 'url': getRecordedUrl(request.uri) }
+                if self.cassette.recording():
+                    self.chargeQuota(request)
+                    response = request.execute(http=self.http(), num_retries=self.retries)
+                    self.cassette.save('youtube', recorded, { 'status': 200, 'body': response })
                 else:
-                    # If the file doesn't exist, assume the result is empty
-                    response = {
+                    response = self.cassette.load('youtube', recorded)
+                    # If the request wasn't recorded, assume the result is empty
+                    response = response['body'] if response else {
                         "kind": "youtube#testNotFoundResponse",
                         "etag": "testNotFoundEtag",
                         "items": []
                     }
+                if etag and response.get('etag') == etag:
+                    response = None
             else:
-                # Loading real data that will be saved later as test data
-                response = request.execute()
-
-            if self.config['test'] == 'save':
-                if len(response['items']):
-                    with open(path, mode='w', encoding='utf-8') as file:
-                        json.dump(response, file, indent='\t')
-                elif os.path.exists(path):
-                    os.unlink(path)
-            return response
-        else:
-            return request.execute()
+                if etag:
+                    request.headers['If-None-Match'] = etag
+                self.chargeQuota(request)
+                try:
+                    response = request.execute(http=self.http(), num_retries=self.retries)
+                except HttpError as error:
+                    # 304 Not Modified is raised as an error, as it isn't a success status
+                    if etag and error.resp.status == 304:
+                        response = None
+                    else:
+                        raise
+        if response is None:
+            metrics.count('youtube.not-modified')
+        return response
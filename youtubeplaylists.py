@@ -1,5 +1,6 @@
 import os
 import yaml
+import pickle
 
 class YouTubePlaylists():
     def __init__(self, youtubeAPI, channelId, singleMode = False):
@@ -12,9 +13,53 @@ class YouTubePlaylists():
         self.videos = {}
         self.playlistsChanged = False
 
+        # In single mode, the videos whose playlists have been found, and whether all the playlists' items have been fetched
+        self.resolved = set()
+        self.complete = False
+
+        # The pages of each playlist's items, as last fetched, so they can be requested with their etag, and aren't downloaded again if they haven't changed
+        # Dictionary of playlist id: [ { pageToken, etag, nextPageToken, videoIds } ]
+        self.cachePath = youtubeAPI.config['playlist-cache'] if 'playlist-cache' in youtubeAPI.config else 'playlist-cache.pickle'
+        self.pages = {}
+        # The videos in each playlist, and the playlist's etag and item count when they were fetched
+        # Dictionary of playlist id: { etag, itemCount, videoIds }
+        self.members = {}
+        self.cacheChanged = False
+
+        # The current etag and item count of each playlist on the channel, or None if they haven't been requested yet
+        # Dictionary of playlist id: { etag, itemCount }
+        self.versions = None
+
+    # Find the playlists of the videos, in as few requests as possible
+    # In single mode, call this with all the videos that will be looked up, rather than letting names look them up one at a time
+    def resolve(self, videoIds):
+        if not self.singleMode or self.complete:
+            # All the playlists' items are already known
+            return
+        unresolved = [videoId for videoId in dict.fromkeys(videoIds) if videoId not in self.resolved]
+        if len(unresolved) == 0:
+            return
+
+        # Looking a video up takes a request per playlist. Getting all the playlists' items takes a request per page
+        # of the playlists that have changed since they were cached, after finding which those are.
+        if self.versions is None:
+            # Only the versions are needed. The list of playlists is the one in the file.
+            self.listPlaylists()
+        allPages = sum(
+            0 if self.unchanged(playlist) else len(self.pages[playlist['id']]) if playlist['id'] in self.pages else 1
+            for playlist in self.playlists.values()
+        )
+        if len(unresolved) * len(self.playlists) < allPages:
+            for videoId in unresolved:
+                self.getVideoPlaylists(videoId)
+            self.resolved.update(unresolved)
+        else:
+            self.getPlaylistItems()
+            self.complete = True
+
     def names(self, videoId):
         if self.singleMode:
-            self.getPlaylistItems(videoId)
+            self.resolve([videoId])
         # TODO: Re-load the playlists?  Maybe there's a new one
         playlistNames = []
         for playlistNo in self.videos[videoId] if videoId in self.videos else []:
@@ -31,10 +76,11 @@ class YouTubePlaylists():
     #     self.playlistsChanged = True
 
     def load(self):
+        self.loadCache()
         if self.singleMode:
             self.loadFromFile()
             if len(self.playlists) == 0:
-                raise "No playlists"
+                raise ValueError("No playlists")
         else:
             # Get playlists via YouTube API
             self.loadFromAPI()
@@ -45,54 +91,83 @@ class YouTubePlaylists():
         playlistNo = 1
 
         # Get playlists
+        for item in self.listPlaylists():
+            self.playlists[ playlistNo ] = { 'id': item['id'], 'title': item['snippet']['title'], 'count': 0 }
+            playlistNo += 1
+            self.playlistsChanged = True
+
+    # Get the channel's playlists, and record their versions
+    def listPlaylists(self):
+        items = []
+        self.versions = {}
         pageToken = ''
         while pageToken is not None:
-            request = self.youtubeAPI.youtube.playlists().list(
-                channelId = self.channelId,
-                part = 'snippet',
-                maxResults = 50,
-                pageToken = pageToken,
-                fields = 'nextPageToken,items(id,snippet(title))'
-            )
-            response = self.youtubeAPI.execute(request, ['channelId', 'pageToken'])
+            response = self.youtubeAPI.execute(self.playlistsRequest(pageToken))
 
             for item in response['items']:
-                self.playlists[ playlistNo ] = { 'id': item['id'], 'title': item['snippet']['title'], 'count': 0 }
-                playlistNo += 1
-                self.playlistsChanged = True
+                self.versions[item['id']] = {
+                    'etag': item['etag'] if 'etag' in item else None,
+                    'itemCount': item['contentDetails']['itemCount'] if 'contentDetails' in item else None
+                }
+                items.append(item)
             pageToken = response['nextPageToken'] if 'nextPageToken' in response else None
+        return items
+
+    # The request for a page of the channel's playlists
+    def playlistsRequest(self, pageToken):
+        return self.youtubeAPI.youtube.playlists().list(
+            channelId = self.channelId,
+            part = 'snippet,contentDetails',
+            maxResults = 50,
+            pageToken = pageToken,
+            fields = 'nextPageToken,items(id,etag,snippet(title),contentDetails(itemCount))'
+        )
 
-    def getPlaylistItems(self, singleVideoId = None ):
-        if len(self.playlists) == 0 and singleVideoId:
-            raise 'getPlaylistItems: playlists must be populated in only-new mode'
+    # Return True if the playlist has the same etag and item count as when its items were cached
+    def unchanged(self, playlist):
+        version = self.versions.get(playlist['id']) if self.versions else None
+        members = self.members.get(playlist['id'])
+        return version is not None and members is not None \
+            and version['etag'] is not None and version['etag'] == members['etag'] \
+            and version['itemCount'] == members['itemCount']
 
+    # Get the items of every playlist
+    # The items of playlists that haven't changed since they were cached are taken from the cache, without any requests.
+    # The pages of the other playlists are requested concurrently, a playlist per thread.
+    def getPlaylistItems(self):
         self.videos = {}
 
-        # For each playlist
+        changed = [playlist for playlist in self.playlists.values() if not self.unchanged(playlist)]
+        changedPages = dict(zip([playlist['id'] for playlist in changed], self.youtubeAPI.map(self.getPlaylistPages, changed)))
+
+        # For each playlist, in order
         for playlistNo, playlist in self.playlists.items():
-            # Get the videos for this playlist
-            pageToken = ''
-            while pageToken is not None:
-                request = self.youtubeAPI.youtube.playlistItems().list(
-                    playlistId = playlist['id'],
-                    videoId = singleVideoId if singleVideoId else '',
-                    part = 'snippet',
-                    maxResults = 50,
-                    fields = 'nextPageToken,items(snippet(title,resourceId(videoId)))',
-                    pageToken = pageToken
-                )
-                response = self.youtubeAPI.execute(request, ['playlistId', 'videoId', 'pageToken'])
-                for item in response['items']:
-                    if item['snippet']['title'] != "Private video":
-                        videoId = item['snippet']['resourceId']['videoId']
-                        if videoId in self.videos:
-                            # Add the playlist to the list of playlists that this video is on
-                            self.videos[videoId].append(playlistNo)
-                        else:
-                            # Add this video/playlist to the list of videos
-                            self.videos[videoId] = [ playlistNo ]
-                        playlist['count'] += 1
-                pageToken = response['nextPageToken'] if 'nextPageToken' in response else None
+            if playlist['id'] not in changedPages:
+                for videoId in self.members[playlist['id']]['videoIds']:
+                    self.addVideo(videoId, playlistNo)
+                continue
+
+            pages = changedPages[playlist['id']]
+            for page in pages:
+                for videoId in page['videoIds']:
+                    self.addVideo(videoId, playlistNo)
+
+            cachedPages = self.pages[playlist['id']] if playlist['id'] in self.pages else []
+            if pages != cachedPages:
+                self.pages[playlist['id']] = pages
+                self.cacheChanged = True
+
+            # Remember the playlist's videos, with the version they belong to
+            version = self.versions.get(playlist['id']) if self.versions else None
+            if version:
+                members = {
+                    'etag': version['etag'],
+                    'itemCount': version['itemCount'],
+                    'videoIds': [videoId for page in pages for videoId in page['videoIds']]
+                }
+                if members != self.members.get(playlist['id']):
+                    self.members[playlist['id']] = members
+                    self.cacheChanged = True
 
         # # Resolve duplicates
         # for videoId, playlistNos in self.videos.items():
@@ -120,6 +195,72 @@ class YouTubePlaylists():
         #     for playlistNo in playlistNos:
         #         del self.playlists[playlistNo]
 
+    # Get the pages of a playlist's items, requesting each page with its cached etag
+    # This runs on the API's threads, so it only reads the cache
+    def getPlaylistPages(self, playlist):
+        cachedPages = self.pages[playlist['id']] if playlist['id'] in self.pages else []
+        pages = []
+        pageToken = ''
+        while pageToken is not None:
+            # The cached page is only used if the previous pages were the same, so it's the same page of the playlist
+            cachedPage = cachedPages[len(pages)] if len(pages) < len(cachedPages) and cachedPages[len(pages)]['pageToken'] == pageToken else None
+            response = self.youtubeAPI.execute(self.playlistPageRequest(playlist['id'], pageToken), cachedPage['etag'] if cachedPage else None)
+            if response is None:
+                # Not modified
+                page = cachedPage
+            else:
+                page = {
+                    'pageToken': pageToken,
+                    'etag': response['etag'] if 'etag' in response else None,
+                    'nextPageToken': response['nextPageToken'] if 'nextPageToken' in response else None,
+                    'videoIds': [item['snippet']['resourceId']['videoId'] for item in response['items'] if item['snippet']['title'] != "Private video"]
+                }
+            pages.append(page)
+            pageToken = page['nextPageToken']
+        return pages
+
+    # The request for a page of a playlist's items
+    def playlistPageRequest(self, playlistId, pageToken):
+        return self.youtubeAPI.youtube.playlistItems().list(
+            playlistId = playlistId,
+            videoId = '',
+            part = 'snippet',
+            maxResults = 50,
+            fields = 'etag,nextPageToken,items(snippet(title,resourceId(videoId)))',
+            pageToken = pageToken
+        )
+
+    # Find the playlists that a video is in, with a request for each playlist, run concurrently
+    def getVideoPlaylists(self, videoId):
+        if len(self.playlists) == 0:
+            raise ValueError('getVideoPlaylists: playlists must be populated in only-new mode')
+
+        def getPlaylistItem(playlist):
+            request = self.youtubeAPI.youtube.playlistItems().list(
+                playlistId = playlist['id'],
+                videoId = videoId,
+                part = 'snippet',
+                maxResults = 50,
+                fields = 'nextPageToken,items(snippet(title,resourceId(videoId)))',
+                pageToken = ''
+            )
+            return self.youtubeAPI.execute(request)
+
+        responses = self.youtubeAPI.map(getPlaylistItem, self.playlists.values())
+        for playlistNo, response in zip(self.playlists.keys(), responses):
+            for item in response['items']:
+                if item['snippet']['title'] != "Private video":
+                    self.addVideo(item['snippet']['resourceId']['videoId'], playlistNo)
+
+    def addVideo(self, videoId, playlistNo):
+        if videoId in self.videos:
+            # Add the playlist to the list of playlists that this video is on
+            self.videos[videoId].append(playlistNo)
+        else:
+            # Add this video/playlist to the list of videos
+            self.videos[videoId] = [ playlistNo ]
+        self.playlists[playlistNo]['count'] += 1
+
     def loadFromFile(self):
         configpath = 'playlists.yaml'
         if os.path.isfile(configpath):
@@ -130,7 +271,29 @@ class YouTubePlaylists():
             except Exception as error:
                 print(f"Error reading the playlists file ({type(error).__name__}): {error}")
 
+    def loadCache(self):
+        if os.path.isfile(self.cachePath):
+            try:
+                with open(self.cachePath, mode='rb') as file:
+                    cache = pickle.load(file)
+                self.pages = cache['pages']
+                self.members = cache['members'] if 'members' in cache else {}
+            except Exception as error:
+                print(f"Error reading the playlist cache ({type(error).__name__}): {error}")
+
+    def saveCache(self):
+        if self.cacheChanged:
+            try:
+                temppath = self.cachePath + '.tmp'
+                with open(temppath, mode='wb') as file:
+                    pickle.dump({ 'pages': self.pages, 'members': self.members }, file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temppath, self.cachePath)
+                self.cacheChanged = False
+            except Exception as error:
+                print(f"Error writing the playlist cache ({type(error).__name__}): {error}")
+
     def save(self):
+        self.saveCache()
         if self.playlistsChanged:
             try:
                 with open('playlists.yaml', mode='w', encoding='utf-8') as configfile: